@@ -1,24 +1,60 @@
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-import matplotlib.animation as animation
 import json
+import hashlib
+import os
+import warnings
+import weakref
+from profiling import NULL_PROFILER
+from observers import ConsoleObserver, Event
 
 def load_constants(file_path="physical_and_numerical_data.json"):
     with open(file_path, "r") as file:
         constants = json.load(file)
     return constants
 
-constants = load_constants()
+REFERENCE_CELL_AREA = 0.25
+REFERENCE_TIME_STEP = 0.5
 
-ht = constants["ht"]
-hx = constants["hx"]
-air_density = constants["air_density"]
-spec_heat = constants["spec_heat"]
-power = constants["power"]  
-diff_coeff = constants["diff_coeff"]
+class SimulationConfig:
+    default_file = "physical_and_numerical_data.json"
+    loaded = {}
 
-heat = power / (air_density * spec_heat * 0.25)
+    def __init__(self, ht, hx, air_density, spec_heat, power, diff_coeff):
+        self.ht = ht
+        self.hx = hx
+        self.air_density = air_density
+        self.spec_heat = spec_heat
+        self.power = power
+        self.diff_coeff = diff_coeff
+        # the heater power is given per cell of the reference 0.5 m grid
+        self.heat = power / (air_density * spec_heat * REFERENCE_CELL_AREA)
+        self.area_scale = hx**2 / REFERENCE_CELL_AREA
+        # energy is counted in doses of a reference cell over a reference step, so totals do not depend on ht or hx
+        self.energy_scale = self.area_scale / REFERENCE_TIME_STEP
+
+    @classmethod
+    def from_file(cls, file_path=default_file):
+        return cls(**load_constants(file_path))
+
+    @classmethod
+    def default(cls):
+        path = os.path.abspath(cls.default_file)
+        if path not in cls.loaded:
+            cls.loaded[path] = cls.from_file(path)
+        return cls.loaded[path]
+
+    def as_dict(self):
+        return {"ht": self.ht, "hx": self.hx, "air_density": self.air_density, "spec_heat": self.spec_heat,
+                "power": self.power, "diff_coeff": self.diff_coeff}
+
+    def replace(self, **changes):
+        return SimulationConfig(**{**self.as_dict(), **changes})
+
+    def stable_time_step(self):
+        return self.hx**2 / (4 * self.diff_coeff)
+
+    def rate(self, dt):
+        return self.diff_coeff * dt / self.hx**2
 
 def matrix(n):
     matrix = np.zeros((n, n))
@@ -39,65 +75,343 @@ def diff_matrix(N, M):
     R = np.kron(dY, np.eye(N))
     return L + R
 
+def laplacian(u, out=None, links_x=None, links_y=None):
+    if out is None:
+        out = np.empty_like(u)
+    np.multiply(u, -4, out=out)
+    if links_x is None:
+        out[..., :, 1:] += u[..., :, :-1]
+        out[..., :, :-1] += u[..., :, 1:]
+    else:
+        out[..., :, 1:] += links_x * u[..., :, :-1]
+        out[..., :, :-1] += links_x * u[..., :, 1:]
+    if links_y is None:
+        out[..., 1:, :] += u[..., :-1, :]
+        out[..., :-1, :] += u[..., 1:, :]
+    else:
+        out[..., 1:, :] += links_y * u[..., :-1, :]
+        out[..., :-1, :] += links_y * u[..., 1:, :]
+    return out
+
+CONDUCTING, FIXED, INSULATED = 0, 1, 2
+
+def line_coefficients(kinds, rate, links=None):
+    lines, n = kinds.shape
+    if links is None:
+        links = np.ones((lines, n - 1), dtype=bool)
+    conducting = kinds == CONDUCTING
+    open_cells = kinds != INSULATED
+    lower = np.zeros((lines, n))
+    diagonal = np.ones((lines, n))
+    upper = np.zeros((lines, n))
+    forward = rate * (links & conducting[:, :-1] & open_cells[:, 1:])
+    diagonal[:, :-1] += forward
+    upper[:, :-1] -= forward
+    backward = rate * (links & conducting[:, 1:] & open_cells[:, :-1])
+    diagonal[:, 1:] += backward
+    lower[:, 1:] -= backward
+    return lower, diagonal, upper
+
+class LineSolver:
+    # Thomas algorithm for one tridiagonal system per grid line; the elimination is done once here and
+    # the coefficients are stored position-major, so every sweep step reads one contiguous row
+    def __init__(self, kinds, rate, links=None, dtype=np.float64):
+        lower, diagonal, upper = line_coefficients(kinds, rate, links)
+        n = kinds.shape[1]
+        pivots = np.empty_like(diagonal)
+        eliminated = np.empty_like(upper)
+        pivots[:, 0] = 1 / diagonal[:, 0]
+        eliminated[:, 0] = upper[:, 0] * pivots[:, 0]
+        for i in range(1, n):
+            pivots[:, i] = 1 / (diagonal[:, i] - lower[:, i] * eliminated[:, i - 1])
+            eliminated[:, i] = upper[:, i] * pivots[:, i]
+        self.pivots = np.ascontiguousarray(pivots.T, dtype=dtype)
+        self.lower = list(np.ascontiguousarray((lower * pivots).T, dtype=dtype))
+        self.upper = list(np.ascontiguousarray(eliminated.T, dtype=dtype))
+        self.matrix = tuple(np.ascontiguousarray(coefficients.T, dtype=dtype) for coefficients in (lower, diagonal, upper))
+
+    def lines(self, coefficients, ndim):
+        return coefficients.reshape(coefficients.shape[:1] + (1,) * (ndim - 2) + coefficients.shape[1:])
+
+    def solve(self, values):
+        # values has the position along the line first and the line last; it is overwritten with the solution
+        values *= self.lines(self.pivots, values.ndim)
+        rows = list(values)
+        term = np.empty_like(rows[0])
+        for i in range(1, len(rows)):
+            np.multiply(self.lower[i], rows[i - 1], out=term)
+            np.subtract(rows[i], term, out=rows[i])
+        for i in range(len(rows) - 2, -1, -1):
+            np.multiply(self.upper[i], rows[i + 1], out=term)
+            np.subtract(rows[i], term, out=rows[i])
+        return values
+
+    def multiply(self, values, out):
+        # the product of the same tridiagonal matrix with values, in the layout of solve()
+        lower, diagonal, upper = (self.lines(coefficients, values.ndim) for coefficients in self.matrix)
+        np.multiply(diagonal, values, out=out)
+        out[1:] += lower[1:] * values[:-1]
+        out[:-1] += upper[:-1] * values[1:]
+        return out
+
+class ExplicitIntegrator:
+    def __init__(self, kinds, rate, links_x=None, links_y=None, dtype=np.float64):
+        self.rate = rate
+        self.links_x = links_x
+        self.links_y = links_y
+        self.lap = np.empty(kinds.shape, dtype=dtype)
+
+    def step(self, previous, out):
+        if self.lap.shape != previous.shape or self.lap.dtype != previous.dtype:
+            self.lap = np.empty_like(previous)
+        laplacian(previous, self.lap, self.links_x, self.links_y)
+        np.add(previous, self.rate * self.lap, out=out)
+
+class ADIIntegrator:
+    # Douglas ADI: a backward-Euler sweep along the rows with the column term kept explicit, then a sweep along
+    # the columns that takes that explicit term back. Two plain backward-Euler sweeps are cheaper, but their
+    # steady state moves with the step, which over long steps underestimates the heat lost through windows
+    def __init__(self, kinds, rate, links_x=None, links_y=None, dtype=np.float64):
+        self.solve_x = LineSolver(kinds, rate, links_x, dtype)
+        self.solve_y = LineSolver(kinds.T, rate, None if links_y is None else links_y.T, dtype)
+        self.work = None
+        self.explicit = None
+
+    def step(self, previous, out):
+        # rows are solved on a transposed copy, columns in place on out
+        shape = (previous.shape[-1],) + previous.shape[:-1]
+        if self.work is None or self.work.shape != shape or self.work.dtype != previous.dtype:
+            self.work = np.empty(shape, dtype=previous.dtype)
+            self.explicit = np.empty(previous.shape, dtype=previous.dtype)
+        # explicit holds (I - rate * A_y) previous
+        self.solve_y.multiply(np.moveaxis(previous, -2, 0), np.moveaxis(self.explicit, -2, 0))
+        np.subtract(2 * np.moveaxis(previous, -1, 0), np.moveaxis(self.explicit, -1, 0), out=self.work)
+        self.solve_x.solve(self.work)
+        np.copyto(out, np.moveaxis(self.work, 0, -1))
+        out += self.explicit
+        out -= previous
+        self.solve_y.solve(np.moveaxis(out, -2, 0))
+
+INTEGRATORS = {"explicit": ExplicitIntegrator, "adi": ADIIntegrator}
+
+def fused_explicit_step(previous, out, rate, links_x, links_y, wall_cells, wall_sources, corners, corner_sources,
+                        window_cells, outside):
+    # one pass per batch member: the same sums in the same order as laplacian(), then walls, corners and windows
+    height, width = links_x.shape[0], links_y.shape[1]
+    for b in range(previous.shape[0]):
+        for i in range(height):
+            for j in range(width):
+                k = i * width + j
+                lap = -4 * previous[b, k]
+                if j > 0 and links_x[i, j - 1]:
+                    lap += previous[b, k - 1]
+                if j < width - 1 and links_x[i, j]:
+                    lap += previous[b, k + 1]
+                if i > 0 and links_y[i - 1, j]:
+                    lap += previous[b, k - width]
+                if i < height - 1 and links_y[i, j]:
+                    lap += previous[b, k + width]
+                out[b, k] = previous[b, k] + rate * lap
+        for n in range(len(wall_cells)):
+            out[b, wall_cells[n]] = out[b, wall_sources[n]]
+        for n in range(len(corners)):
+            out[b, corners[n]] = out[b, corner_sources[n]]
+        for n in range(len(window_cells)):
+            out[b, window_cells[n]] = outside[b]
+
+BACKENDS = ("numpy", "numba", "python")
+KERNELS = {}
+
+def fused_kernel(backend, method):
+    if backend not in BACKENDS:
+        raise ValueError(f"nieznany backend {backend!r}, dostępne: {', '.join(BACKENDS)}")
+    if backend == "numpy":
+        return None
+    if method != "explicit":
+        raise ValueError(f"backend {backend} obsługuje tylko schemat jawny")
+    if backend == "python":
+        # the same kernel run by the interpreter: far too slow to simulate with, but it checks the compiled one
+        return fused_explicit_step
+    if backend not in KERNELS:
+        try:
+            import numba
+        except ImportError:
+            warnings.warn("pakiet numba nie jest zainstalowany, obliczenia wykona NumPy", RuntimeWarning)
+            return None
+        KERNELS[backend] = numba.njit(cache=True)(fused_explicit_step)
+    return KERNELS[backend]
+
+SNAPSHOT_EVERY = 300
+
+class History:
+    def __init__(self, n_steps, shape, every=None, steps=None, dtype=np.float64):
+        self.n_steps = n_steps
+        if every is None and steps is None:
+            every = 1
+        recorded = set()
+        if every is not None:
+            recorded.update(range(0, n_steps, every))
+        if steps is not None:
+            recorded.update(int(step) for step in steps if 0 <= step < n_steps)
+        self.steps = np.array(sorted(recorded), dtype=int)
+        self.data = np.zeros((len(self.steps),) + tuple(np.atleast_1d(shape)), dtype=dtype)
+
+    def __len__(self):
+        return self.n_steps
+
+    def __contains__(self, t):
+        i = np.searchsorted(self.steps, t)
+        return i < len(self.steps) and self.steps[i] == t
+
+    def index(self, t):
+        if t < 0:
+            t += self.n_steps
+        i = np.searchsorted(self.steps, t)
+        if i == len(self.steps) or self.steps[i] != t:
+            raise IndexError(f"krok {t} nie został zapisany")
+        return i
+
+    def record(self, t, values):
+        if t in self:
+            self.data[self.index(t)] = values
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            t, cells = key[0], key[1:]
+            return self.data[self.index(t)][cells]
+        return self.data[self.index(key)]
+
+class RoomHistory:
+    # the snapshots of a room inside a House, read from the house history through the room's cells
+    def __init__(self, history, cells):
+        self.history = history
+        self.cells = cells
+
+    @property
+    def steps(self):
+        return self.history.steps
+
+    def __len__(self):
+        return len(self.history)
+
+    def __contains__(self, t):
+        return t in self.history
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            return self.history[key[0]][..., self.cells][key[1:]]
+        return self.history[key][..., self.cells]
+
+
+def room_boundary(N, M):
+    index = np.arange(N * M).reshape(M, N)
+    edge = np.zeros((M, N), dtype=bool)
+    edge[[0, -1], :] = True
+    edge[:, [0, -1]] = True
+    ring = ~edge
+    ring[2:-2, 2:-2] = False
+    walls = index[edge]
+    # a wall copies the first of its right, left, lower and upper neighbours that lies on the inner ring
+    candidates = walls[:, None] + np.array([1, -1, -N, N])
+    inside = (candidates >= 0) & (candidates < N * M)
+    valid = inside & ring.ravel()[np.where(inside, candidates, 0)]
+    has_source = valid.any(axis=1)
+    wall_cells = walls[has_source]
+    wall_sources = candidates[has_source, np.argmax(valid[has_source], axis=1)]
+    corners = np.array([0, N - 1, N * (M - 1), N * M - 1])
+    corner_sources = np.array([1, N - 2, N * (M - 1) + 1, N * M - 2])
+    return walls, index[~edge], index[ring], wall_cells, wall_sources, corners, corner_sources
+
+def heater_surroundings(cords, N, interior_mask):
+    cords = np.asarray(cords, dtype=int)
+    candidates = (cords[:, None] + np.array([1, -1, N, -N])).ravel()
+    inside = (candidates >= 0) & (candidates < len(interior_mask))
+    keep = inside & interior_mask[np.where(inside, candidates, 0)] & ~np.isin(candidates, cords)
+    return candidates[keep]
+
 class Room:
-    def __init__(self, N, M, times, initial_temperature, time = 0):
+    def __init__(self, N, M, times, initial_temperature, time = 0, record_every = None, record_steps = None, buffer = None,
+                 integrator = "explicit", config = None):
+        self.config = SimulationConfig.default() if config is None else config
         self.N = N
         self.M = M
         self.k = len(times)
         self.t = time
+        self.dt = times[1] - times[0] if len(times) > 1 else self.config.ht
+        limit = self.config.stable_time_step()
+        if integrator == "explicit" and self.dt > limit:
+            raise ValueError(f"krok czasowy {self.dt} s jest zbyt duży dla schematu jawnego (maks. {limit} s)")
+        self.method = integrator
+        self._integrator = None
         self.x = np.linspace(0, N, N + 1)
         self.y = np.linspace(0, M, M + 1)
         self.x, self.y = np.meshgrid(self.x, self.y)
-        self.u = np.zeros((self.k, N * M))
-        self.u[0, :] += initial_temperature
-        self.Mat = diff_matrix(self.N, self.M)
-        IB1 = [i for i in range(N * M) if i % N == 0]
-        IB2 = [i for i in range(N * M) if (i + 1) % N == 0]
-        IB3 = [i for i in range(N * M) if i < N]
-        IB4 = [i for i in range(N * M) if N * M - N <= i]
-        self.walls = list(set(IB1 + IB2 + IB3 + IB4))
-        self.interior = [i for i in range(N * M) if i not in self.walls]
-
-        IB1N = [i for i in range(N * M) if (i - 1) % N == 0 and (i not in self.walls)]
-        IB2N = [i for i in range(N * M) if (i + 2) % N == 0 and (i not in self.walls)]
-        IB3N = [i for i in range(N * M) if i >= N and i < (2 * N) and (i not in self.walls)]
-        IB4N = [i for i in range(N * M) if (N * M - 2 * N) <= i and i < (N * M - N) and (i not in self.walls)]
-        self.neighbors = list(set(IB1N + IB2N + IB3N + IB4N))
+        self.buffer = np.zeros((2, N * M)) if buffer is None else buffer
+        self.buffer[self.t % 2, :] += initial_temperature
+        if record_every is None and record_steps is None:
+            record_every = max(1, int(round(SNAPSHOT_EVERY / self.dt)))
+        self.house = None
+        self.recorded = History(self.k, N * M, record_every, record_steps)
+        self.recorded.record(self.t, self.current)
+        (self.walls, self.interior, self.neighbors, self.wall_cells, self.wall_sources,
+         self.corners, self.corner_sources) = room_boundary(N, M)
+        self.interior_mask = np.zeros(N * M, dtype=bool)
+        self.interior_mask[self.interior] = True
+        self.kinds = np.full(N * M, CONDUCTING)
+        self.kinds[self.walls] = INSULATED
+        self.origin = (0, 0)
+        self.cells = np.arange(N * M)
+
+    @property
+    def integrator(self):
+        if self._integrator is None:
+            self._integrator = INTEGRATORS[self.method](self.kinds.reshape(self.M, self.N), self.config.rate(self.dt))
+        return self._integrator
+
+    def check_standalone(self):
+        if self.house is not None:
+            raise RuntimeError("pokój jest częścią domu; jego siatkę ustala układ mieszkania, a symulację House.main()")
+
+    def fix_cells(self, cells):
+        self.check_standalone()
+        self.kinds[cells] = FIXED
+        self._integrator = None
     
-    def step(self):
+    @property
+    def current(self):
+        if self.house is None:
+            return self.buffer[self.t % 2]
+        # a room inside a House has no field of its own, this is a copy of its cells of the current house state
+        return self.house.state[self.house.t % 2][..., self.cells]
+
+    @property
+    def u(self):
+        return self.recorded if self.house is None else RoomHistory(self.house.history, self.cells)
+
+    def record(self):
+        self.check_standalone()
+        self.recorded.record(self.t, self.current)
+
+    def advance(self, previous, out):
+        self.integrator.step(previous.reshape(self.M, self.N), out.reshape(self.M, self.N))
+        out[self.wall_cells] = out[self.wall_sources]
+        out[self.corners] = out[self.corner_sources]
+
+    def step(self, record=True):
+        self.check_standalone()
+        previous = self.current
         self.t += 1
-        self.u[self.t, :] = self.u[self.t - 1, :] + (ht * diff_coeff) / hx**2 * np.matmul(self.Mat, self.u[self.t - 1, :])
-        for i in self.walls:
-            if (i + 1) in self.neighbors:
-                self.u[self.t, i] = self.u[self.t, i + 1]
-            elif (i - 1) in self.neighbors:
-                self.u[self.t, i] = self.u[self.t, i - 1]
-            elif (i - self.N) in self.neighbors:
-                self.u[self.t, i] = self.u[self.t, i - self.N]
-            elif (i + self.N) in self.neighbors:
-                self.u[self.t, i] = self.u[self.t, i + self.N]
-
-        for i in [0, self.N - 1, self.N * (self.M - 1), self.N * self.M - 1]:
-            if i == 0:  
-                self.u[self.t, i] = self.u[self.t, i + 1]  
-            elif i == self.N - 1:  
-                self.u[self.t, i] = self.u[self.t, i - 1]  
-            elif i == (self.N * (self.M - 1)):  
-                self.u[self.t, i] = self.u[self.t, i + 1] 
-            elif i == (self.N * self.M - 1):  
-                self.u[self.t, i] = self.u[self.t, i - 1]  
+        self.advance(previous, self.current)
+
+        if record:
+            self.record()
 
     def average_temperature(self):
-        return np.sum(self.u[self.t, self.interior]) / ((self.N - 2) * (self.M - 2)) 
+        return np.sum(self.current[..., self.interior], axis=-1) / ((self.N - 2) * (self.M - 2))
     
     def show_room(self):
-        plt.figure()
-        plt.pcolormesh(self.x, self.y, self.u[200, :].reshape(self.M, self.N), shading='auto')
-        plt.colorbar(label="Temperatura")
-        plt.xlabel("x")
-        plt.ylabel("y")
-        plt.title("Rozkład temperatury w czasie końcowym")
-        plt.show()
+        import visualization
+        visualization.show_room(self)
         
        
 class Window:
@@ -106,36 +420,282 @@ class Window:
         self.cords = cords
 
 class Heater:
-    def __init__(self, room, cords, mode=3):
+    def __init__(self, room, cords, mode=3, weight=1.0, sensor=None):
         self.room = room
         self.cords = cords 
-        self.mode = mode
+        self.weight = weight
         self.modes_temperatures = [7, 12, 15, 19, 24, 28]
-        self.max_temperature = self.modes_temperatures[mode]
-        self.surroundings = self.get_surroundings()
-        self.on = True
+        if sensor is None:
+            self.surroundings = self.get_surroundings()
+            self.surrounding_weights = np.ones(len(self.surroundings))
+        else:
+            self.surroundings = np.asarray(sensor["cells"], dtype=int)
+            self.surrounding_weights = np.asarray(sensor["weights"], dtype=float)
+        self.bank = None
+        self.index = None
+        self._mode = mode
+        self._on = True
+
+    @property
+    def mode(self):
+        return self._mode if self.bank is None else self.bank.modes[..., self.index]
+
+    @property
+    def max_temperature(self):
+        if self.bank is None:
+            return self.modes_temperatures[self.mode]
+        return self.bank.max_temperatures[..., self.index]
+
+    @property
+    def on(self):
+        return self._on if self.bank is None else self.bank.on[..., self.index]
+
+    @on.setter
+    def on(self, value):
+        if self.bank is None:
+            self._on = value
+        else:
+            self.bank.on[..., self.index] = value
 
     def set_mode(self, new_mode):
-        if new_mode in [0, 1, 2, 3, 4, 5]:
-            self.mode = new_mode 
-            self.max_temperature = self.modes_temperatures[self.mode]   
+        if self.bank is not None:
+            # a mode per scenario on a batched house; invalid modes leave that scenario unchanged
+            valid = (np.asarray(new_mode) >= 0) & (np.asarray(new_mode) < len(self.modes_temperatures))
+            self.bank.modes[..., self.index] = np.where(valid, new_mode, self.bank.modes[..., self.index])
+        elif new_mode in [0, 1, 2, 3, 4, 5]:
+            self._mode = new_mode
 
     def get_surroundings(self):
-        surroundings = []
-        for cord in self.cords:
-            if ((cord + 1) in self.room.interior) and ((cord + 1) not in self.cords):
-                surroundings.append(cord + 1)
-            if ((cord - 1) in self.room.interior) and ((cord - 1) not in self.cords):
-                surroundings.append(cord - 1)
-            if ((cord + self.room.N) in self.room.interior) and ((cord + self.room.N) not in self.cords):
-                surroundings.append(cord + self.room.N)
-            if ((cord - self.room.N) in self.room.interior) and ((cord - self.room.N) not in self.cords):
-                surroundings.append(cord - self.room.N)
-        return surroundings
-
-    def get_neighboring_temperature(self, t):       
-        return np.mean(self.room.u[t, self.surroundings])
-    
+        return heater_surroundings(self.cords, self.room.N, self.room.interior_mask)
+
+    def get_neighboring_temperature(self):       
+        return np.average(self.room.current[..., self.surroundings], axis=-1, weights=self.surrounding_weights)
+
+
+def group_mean(values, starts, counts):
+    return np.add.reduceat(values, starts, axis=-1) / counts
+
+class HeaterBank:
+    def __init__(self, heaters, passes=1, batch=()):
+        self.heaters = heaters
+        self.passes = passes
+        self.modes_temperatures = np.array(heaters[0].modes_temperatures if heaters else [7, 12, 15, 19, 24, 28])
+        self.modes = np.zeros(batch + (len(heaters),), dtype=int)
+        self.modes[...] = np.stack(np.broadcast_arrays(*[heater.mode for heater in heaters]), axis=-1)
+        self.on = np.ones(batch + (len(heaters),), dtype=bool)
+        self.cells = np.concatenate([heater.room.cells[np.asarray(heater.cords, dtype=int)] for heater in heaters])
+        self.cell_owner = np.repeat(np.arange(len(heaters)), [len(heater.cords) for heater in heaters])
+        self.cell_counts = np.array([len(heater.cords) for heater in heaters])
+        self.cell_weights = np.repeat([float(heater.weight) for heater in heaters], self.cell_counts)
+        self.surroundings = np.concatenate([heater.room.cells[np.asarray(heater.surroundings, dtype=int)] for heater in heaters])
+        self.surrounding_counts = np.array([len(heater.surroundings) for heater in heaters])
+        self.surrounding_starts = np.concatenate([[0], np.cumsum(self.surrounding_counts)[:-1]])
+        self.surrounding_weights = np.concatenate([heater.surrounding_weights for heater in heaters])
+        self.surrounding_totals = np.add.reduceat(self.surrounding_weights, self.surrounding_starts)
+        for i, heater in enumerate(heaters):
+            heater.bank = self
+            heater.index = i
+
+    @property
+    def max_temperatures(self):
+        return self.modes_temperatures[self.modes]
+
+    def set_mode(self, new_mode):
+        new_mode = np.asarray(new_mode)[..., None]
+        valid = (new_mode >= 0) & (new_mode < len(self.modes_temperatures))
+        self.modes[...] = np.where(valid, new_mode, self.modes)
+
+    def neighboring_temperatures(self, u):
+        weighted = u[..., self.surroundings] * self.surrounding_weights
+        return np.add.reduceat(weighted, self.surrounding_starts, axis=-1) / self.surrounding_totals
+
+    def thermostat(self, temperatures, on):
+        limits = self.max_temperatures
+        return np.where(temperatures >= limits, False, np.where(temperatures <= limits - 1, True, on))
+
+    def update(self, u, heat, dt, new_mode=None):
+        temperatures = self.neighboring_temperatures(u)
+        if new_mode is None:
+            self.on = self.thermostat(temperatures, self.on)
+            doses = self.passes * self.on
+        else:
+            # in the legacy loop heaters switch one by one between passes, so heater i runs its first i passes
+            # on the old set-point; with a single pass every heater switches before heating
+            old_passes = np.minimum(np.arange(len(self.heaters)), self.passes) if self.passes > 1 else 0
+            on_old = np.where(old_passes > 0, self.thermostat(temperatures, self.on), self.on)
+            self.set_mode(new_mode)
+            self.on = self.thermostat(temperatures, on_old)
+            doses = old_passes * on_old + (self.passes - old_passes) * self.on
+        cell_doses = doses[..., self.cell_owner] * self.cell_weights
+        u[..., self.cells] += cell_doses * dt * heat
+        return np.sum(cell_doses, axis=-1) * heat
+
+
+# the patch reaches this many diffusion lengths of one implicit step beyond the heaters and their sensors
+PATCH_RINGS = 3
+ADI_MAX_STEP = 30
+
+def grow(mask, allowed, height, width):
+    grid = mask.reshape(height, width)
+    grown = grid.copy()
+    grown[1:] |= grid[:-1]
+    grown[:-1] |= grid[1:]
+    grown[:, 1:] |= grid[:, :-1]
+    grown[:, :-1] |= grid[:, 1:]
+    return grown.ravel() & allowed
+
+def explicit_rows(house, rows, columns, rate):
+    # the rows of one explicit step, walls copied, restricted to the given columns
+    width = house.width
+    source = np.arange(house.height * width)
+    source[house.wall_cells] = house.wall_sources
+    source[house.corners] = source[house.corner_sources]
+    cells = source[rows]
+    i, j = cells // width, cells % width
+    links_x = np.pad(house.links_x, ((0, 0), (1, 1)))
+    links_y = np.pad(house.links_y, ((1, 1), (0, 0)))
+    neighbours = np.stack([cells, cells - 1, cells + 1, cells - width, cells + width], axis=-1)
+    weights = np.stack([np.full(len(cells), 1 - 4 * rate), rate * links_x[i, j], rate * links_x[i, j + 1],
+                        rate * links_y[i, j], rate * links_y[i + 1, j]], axis=-1)
+    position = np.full(len(source), -1)
+    position[columns] = np.arange(len(columns))
+    index = position[np.clip(neighbours, 0, len(source) - 1)]
+    keep = (index >= 0) & (weights != 0)
+    matrix = np.zeros((len(rows), len(columns)))
+    np.add.at(matrix, (np.nonzero(keep)[0], index[keep]), weights[keep])
+    return matrix
+
+def power_sums(matrix, n):
+    # matrix**n and the sum of matrix**k for k < n, by repeated squaring
+    power, total = np.eye(len(matrix)), np.zeros_like(matrix)
+    block, block_sum = matrix, np.eye(len(matrix))
+    while n:
+        if n & 1:
+            total = total + power @ block_sum
+            power = power @ block
+        n >>= 1
+        if n:
+            block_sum = block_sum + block @ block_sum
+            block = block @ block
+    return power, total
+
+class HeaterPatch:
+    # A heater crosses its 1 K band within seconds, much faster than a long implicit step. The heat the heaters
+    # give off is therefore kept apart in field, on the cells around them, and stepped explicitly at the
+    # thermostat step; the thermostat reads it on top of the implicit field, interpolated over the step, and
+    # the heat joins the implicit field once it reaches the cells just outside the patch. The patch is linear
+    # between two switches, so the substeps are not looped over: all readings of a step come from the
+    # matrices below and only the switches found in them are applied one by one.
+    def __init__(self, house, bank, substeps, rings):
+        self.bank = bank
+        self.substeps = substeps
+        rate = house.config.rate(house.dt / substeps)
+        height, width = house.height, house.width
+        allowed = house.covered.copy()
+        allowed[house.window_cells] = False
+        walls = np.zeros(height * width, dtype=bool)
+        walls[house.wall_cells] = True
+        walls[house.corners] = True
+        patch = np.zeros(height * width, dtype=bool)
+        patch[bank.cells] = True
+        patch[bank.surroundings] = True
+        for _ in range(rings):
+            patch = grow(patch, allowed, height, width)
+        # a wall cell goes with the cell it copies
+        patch[house.wall_cells[patch[house.wall_sources]]] = True
+        patch[house.corners[patch[house.corner_sources]]] = True
+        patch &= allowed
+        self.cells = np.flatnonzero(patch)
+        self.edge = np.flatnonzero(grow(patch, allowed & ~walls, height, width) & ~patch)
+        # the walls that copy an edge cell, refreshed once the outflow has been added
+        copies = np.isin(house.wall_sources, self.edge) & ~np.isin(house.wall_cells, house.window_cells)
+        self.wall_cells, self.wall_sources = house.wall_cells[copies], house.wall_sources[copies]
+        copies = np.isin(house.corner_sources, self.wall_cells) & ~np.isin(house.corners, house.window_cells)
+        self.corners, self.corner_sources = house.corners[copies], house.corner_sources[copies]
+        self.field = np.zeros(house.batch + (len(self.cells),))
+
+        position = np.full(height * width, -1)
+        position[self.cells] = np.arange(len(self.cells))
+        heaters = len(bank.heaters)
+        step = explicit_rows(house, self.cells, self.cells, rate)
+        outflow = explicit_rows(house, self.edge, self.cells, rate)
+        sensors = np.zeros((heaters, len(self.cells)))
+        np.add.at(sensors, (np.repeat(np.arange(heaters), bank.surrounding_counts), position[bank.surroundings]),
+                  bank.surrounding_weights)
+        sensors /= bank.surrounding_totals[:, None]
+        doses = np.zeros((len(self.cells), heaters))
+        np.add.at(doses, (position[bank.cells], bank.cell_owner),
+                  bank.passes * bank.cell_weights * house.dt / substeps * house.config.heat)
+
+        # heated[m]: the patch after m substeps of constant heating, readings: the sensors after k substeps of the
+        # patch left alone, responses[m] and leaked[m]: the sensors and the outflow after m substeps of heating
+        heated = np.zeros((substeps + 1, len(self.cells), heaters))
+        readings = np.empty((substeps, heaters, len(self.cells)))
+        term, reading = doses, sensors
+        for m in range(1, substeps + 1):
+            heated[m] = heated[m - 1] + term
+            term = step @ term
+            reading = reading @ step
+            readings[m - 1] = reading
+        responses = sensors @ (heated[1:] - doses)
+        leaked = np.concatenate([np.zeros((1, len(self.edge), heaters)), np.cumsum(outflow @ heated[1:-1], axis=0)])
+        decay, total = power_sums(step, substeps)
+        self.decay = decay.T
+        self.outflow = (outflow @ total).T
+        self.readings = readings.transpose(2, 0, 1).reshape(len(self.cells), -1)
+        self.heated = heated.transpose(0, 2, 1)
+        self.responses = responses.transpose(0, 2, 1)
+        self.leaked = leaked.transpose(0, 2, 1)
+
+    def detach(self, u):
+        # the field without the heat still held on the patch, which is what the implicit step diffuses
+        smooth = u.copy()
+        smooth[..., self.cells] -= self.field
+        return smooth
+
+    def update(self, smooth, u, heat, new_mode=None):
+        bank = self.bank
+        n = self.substeps
+        start = bank.neighboring_temperatures(smooth)
+        end = bank.neighboring_temperatures(u)
+        if new_mode is not None:
+            # every heater switches before the first substep, the staggered legacy switch is a single-step effect
+            bank.set_mode(new_mode)
+        limits = bank.max_temperatures
+        on = bank.on.astype(float)
+        # the sensor readings of every substep, substep first
+        fractions = (np.arange(1, n + 1) / n).reshape((n,) + (1,) * start.ndim)
+        readings = (start + fractions * (end - start)
+                    + np.moveaxis((self.field @ self.readings).reshape(self.field.shape[:-1] + (n, -1)), -2, 0)
+                    + np.einsum("...g,mgh->m...h", on, self.responses))
+        field = self.field @ self.decay + on @ self.heated[n]
+        outflow = self.field @ self.outflow + on @ self.leaked[n - 1]
+        running = n * on
+        state = bank.on
+        first = 0
+        while first < n:
+            ahead = readings[first:]
+            switching = np.where(state, ahead >= limits, ahead <= limits - 1).reshape(n - first, -1).any(axis=1)
+            if not switching.any():
+                break
+            k = first + int(np.argmax(switching))
+            switched = bank.thermostat(readings[k], state)
+            change = switched.astype(float) - state
+            readings[k + 1:] += np.einsum("...g,mgh->m...h", change, self.responses[1:n - k])
+            field += change @ self.heated[n - k]
+            outflow += change @ self.leaked[n - k - 1]
+            running += (n - k) * change
+            state = switched
+            first = k + 1
+        bank.on = state
+        self.field = field
+        u[..., self.cells] += field
+        u[..., self.edge] += outflow
+        u[..., self.wall_cells] = u[..., self.wall_sources]
+        u[..., self.corners] = u[..., self.corner_sources]
+        cell_doses = bank.passes * running[..., bank.cell_owner] / n * bank.cell_weights
+        return np.sum(cell_doses, axis=-1) * heat
+
 
 class Door:
     def __init__(self, room_1, room_2, cords_1, cords_2):
@@ -144,301 +704,731 @@ class Door:
         self.cords_1 = cords_1
         self.cords_2 = cords_2
 
-class House:
-    def __init__(self, initial_temperature, outside_temperatures, heaters_mode, heaters_during_work = 3, initial_mode = 3):
+LAYOUT_CACHE = ".cache/layouts"
+LAYOUT_VERSION = 5
+
+OUTSIDE, FLOOR, WALL, WINDOW, HEATER, DOOR = range(6)
+
+SENSOR_OFFSET = 0.5
+
+def to_cells(length, hx):
+    return int(np.floor(length / hx + 0.5))
+
+def cells_in_span(start, stop, first, count, hx):
+    # cells are taken by their centres; a span narrower than one cell keeps the nearest cell
+    indices = np.arange(first, first + count)
+    centres = (indices + 0.5) * hx
+    inside = indices[(centres >= start - 1e-9) & (centres < stop - 1e-9)]
+    if len(inside) == 0 and count > 0:
+        inside = indices[[np.argmin(np.abs(centres - (start + stop) / 2))]]
+    return inside
+
+def wall_cords(room, side, span, hx):
+    N, M = room["N"], room["M"]
+    if side in ("left", "right"):
+        rows = cells_in_span(*span, room["row"] + 1, M - 2, hx) - room["row"]
+        columns = np.full(len(rows), 0 if side == "left" else N - 1)
+    elif side in ("bottom", "top"):
+        columns = cells_in_span(*span, room["column"] + 1, N - 2, hx) - room["column"]
+        rows = np.full(len(columns), 0 if side == "bottom" else M - 1)
+    else:
+        raise ValueError(f"nieznana ściana: {side}")
+    return (rows * N + columns).tolist()
+
+def area_cords(room, x, y, hx):
+    columns = cells_in_span(*x, room["column"] + 1, room["N"] - 2, hx) - room["column"]
+    rows = cells_in_span(*y, room["row"] + 1, room["M"] - 2, hx) - room["row"]
+    return (rows[:, None] * room["N"] + columns).ravel().tolist()
+
+def cell_overlaps(start, stop, first, count, hx):
+    edges = np.arange(first, first + count + 1) * hx
+    return np.clip(np.minimum(edges[1:], stop) - np.maximum(edges[:-1], start), 0, None)
+
+def rectangle_overlaps(room, x, y, hx):
+    # area of the rectangle inside every interior cell of the room, as an (M - 2, N - 2) array
+    columns = cell_overlaps(*x, room["column"] + 1, room["N"] - 2, hx)
+    rows = cell_overlaps(*y, room["row"] + 1, room["M"] - 2, hx)
+    return np.outer(rows, columns)
+
+def into_interior(start, stop, first, count, hx):
+    # a coarse grid makes the walls thicker, so a heater standing by a wall may lie inside it; move the span into
+    # the interior the way cells_in_span moves its cells
+    low, high = first * hx, (first + count) * hx
+    shift = max(low - start, 0.0) - max(stop - high, 0.0)
+    return max(start + shift, low), min(stop + shift, high)
+
+def sensor_cords(room, x, y, offset, hx):
+    # the thermostat reads the air within offset metres of the sides of the heater, every cell weighted by the part
+    # of that area it covers, so the sensor stays in the same place whatever the grid
+    x0, x1 = into_interior(*x, room["column"] + 1, room["N"] - 2, hx)
+    y0, y1 = into_interior(*y, room["row"] + 1, room["M"] - 2, hx)
+    x, y = (x0, x1), (y0, y1)
+    area = (rectangle_overlaps(room, (x0 - offset, x1 + offset), y, hx)
+            + rectangle_overlaps(room, x, (y0 - offset, y1 + offset), hx) - 2 * rectangle_overlaps(room, x, y, hx))
+    rows, columns = np.nonzero(area > 1e-9)
+    if len(rows) == 0:
+        raise ValueError(f"czujnik grzejnika w pokoju {room['name']} nie obejmuje żadnej komórki")
+    return {"cells": ((rows + 1) * room["N"] + columns + 1).tolist(), "weights": area[rows, columns].tolist()}
+
+def shared_wall(first, second):
+    if first["column"] + first["N"] == second["column"]:
+        return "right", "left"
+    if second["column"] + second["N"] == first["column"]:
+        return "left", "right"
+    if first["row"] + first["M"] == second["row"]:
+        return "top", "bottom"
+    if second["row"] + second["M"] == first["row"]:
+        return "bottom", "top"
+    raise ValueError(f"pokoje {first['name']} i {second['name']} nie mają wspólnej ściany")
+
+def rasterize_plan(plan, heaters_mode, hx):
+    if heaters_mode not in plan["heaters"]:
+        raise ValueError(f"nieznane ustawienie grzejników: {heaters_mode}")
+    rooms = []
+    for room in plan["rooms"]:
+        column, row = to_cells(room["x"], hx), to_cells(room["y"], hx)
+        rooms.append({"name": room["name"], "N": to_cells(room["x"] + room["width"], hx) - column,
+                      "M": to_cells(room["y"] + room["height"], hx) - row, "row": row, "column": column})
+    by_name = {room["name"]: room for room in rooms}
+
+    def find(name):
+        if name not in by_name:
+            raise ValueError(f"nieznany pokój: {name}")
+        return by_name[name]
+
+    windows = [{"room": window["room"], "cells": wall_cords(find(window["room"]), window["wall"], window["span"], hx)}
+               for window in plan["windows"]]
+    doors = []
+    for door in plan["doors"]:
+        first, second = (find(name) for name in door["rooms"])
+        side_1, side_2 = shared_wall(first, second)
+        doors.append({"rooms": door["rooms"], "cells": [wall_cords(first, side_1, door["span"], hx),
+                                                        wall_cords(second, side_2, door["span"], hx)]})
+    heaters = []
+    offset = plan.get("sensor_offset", SENSOR_OFFSET)
+    for heater in plan["heaters"][heaters_mode]:
+        room = find(heater["room"])
+        cords = area_cords(room, heater["x"], heater["y"], hx)
+        # a heater narrower than a cell still takes a whole cell, so its cells share the power of its real area
+        area = (heater["x"][1] - heater["x"][0]) * (heater["y"][1] - heater["y"][0])
+        heaters.append({"room": heater["room"], "cells": cords, "weight": area / (len(cords) * hx**2),
+                        "sensor": sensor_cords(room, heater["x"], heater["y"], offset, hx)})
+    # the original model switched every heater inside a loop over all heaters, so each one delivered one dose per
+    # heater of the layout; a plan has to ask for that explicitly, otherwise each heater delivers its own power once
+    passes = len(heaters) if plan.get("legacy_heater_passes", False) else 1
+    return {"rooms": rooms, "windows": windows, "doors": doors, "heaters": heaters, "heater_passes": passes}
+
+def load_layouts(file_path="layouts.json"):
+    with open(file_path, "r") as file:
+        return json.load(file)
+
+def compile_layout(description):
+    rooms = description["rooms"]
+    names = [room["name"] for room in rooms]
+    if len(set(names)) != len(names):
+        raise ValueError("nazwy pokoi muszą być unikalne")
+    height = max(room["row"] + room["M"] for room in rooms)
+    width = max(room["column"] + room["N"] for room in rooms)
+    room_index = np.full(height * width, -1)
+    kinds = np.full(height * width, INSULATED)
+    categories = np.full(height * width, OUTSIDE)
+    cells, boundaries = [], []
+    for i, room in enumerate(rooms):
+        N, M = room["N"], room["M"]
+        if N < 3 or M < 3 or room["row"] < 0 or room["column"] < 0:
+            raise ValueError(f"pokój {room['name']} ma niepoprawne wymiary lub położenie")
+        local = np.arange(N * M)
+        room_cells = (room["row"] + local // N) * width + room["column"] + local % N
+        if np.any(room_index[room_cells] >= 0):
+            raise ValueError(f"pokój {room['name']} nachodzi na inny pokój")
+        room_index[room_cells] = i
+        boundary = room_boundary(N, M)
+        kinds[room_cells] = CONDUCTING
+        kinds[room_cells[boundary[0]]] = INSULATED
+        categories[room_cells] = FLOOR
+        categories[room_cells[boundary[0]]] = WALL
+        cells.append(room_cells)
+        boundaries.append(boundary)
+
+    def locate(name, cords):
+        if name not in names:
+            raise ValueError(f"nieznany pokój: {name}")
+        i = names.index(name)
+        cords = np.asarray(cords, dtype=int)
+        if np.any((cords < 0) | (cords >= len(cells[i]))):
+            raise ValueError(f"komórki {cords.tolist()} leżą poza pokojem {name}")
+        return i, cords
+
+    window_cells = np.concatenate([cells[i][cords] for i, cords in
+                                   (locate(window["room"], window["cells"]) for window in description["windows"])])
+    kinds[window_cells] = FIXED
+    categories[window_cells] = WINDOW
+
+    heaters = [locate(heater["room"], heater["cells"]) for heater in description["heaters"]]
+    heater_cells = np.concatenate([cells[i][cords] for i, cords in heaters])
+    if len(np.unique(heater_cells)) != len(heater_cells):
+        raise ValueError("grzejniki nie mogą zajmować tych samych komórek")
+    if not all(np.all(np.isin(cords, boundaries[i][1])) for i, cords in heaters):
+        raise ValueError("grzejniki muszą stać wewnątrz pokoi")
+    categories[heater_cells] = HEATER
+
+    grid = room_index.reshape(height, width)
+    links_x = (grid[:, :-1] == grid[:, 1:]) & (grid[:, 1:] >= 0)
+    links_y = (grid[:-1, :] == grid[1:, :]) & (grid[1:, :] >= 0)
+    door_cords = [[] for _ in rooms]
+    for door in description["doors"]:
+        (i, cords_1), (j, cords_2) = (locate(name, cords) for name, cords in zip(door["rooms"], door["cells"]))
+        cells_1, cells_2 = cells[i][cords_1], cells[j][cords_2]
+        for cell in cells_1:
+            distance = np.abs(cells_2 // width - cell // width) + np.abs(cells_2 % width - cell % width)
+            if not np.any(distance == 1):
+                raise ValueError(f"komórka drzwi {cell} nie sąsiaduje z drugim pokojem")
+            first, second = sorted((cell, cells_2[np.argmax(distance == 1)]))
+            if second - first == 1:
+                links_x[first // width, first % width] = True
+            else:
+                links_y[first // width, first % width] = True
+        kinds[cells_1] = CONDUCTING
+        kinds[cells_2] = CONDUCTING
+        categories[cells_1] = DOOR
+        categories[cells_2] = DOOR
+        door_cords[i].extend(cords_1)
+        door_cords[j].extend(cords_2)
+
+    wall_cells, wall_sources, corners, corner_sources = [], [], [], []
+    for room_cells, boundary, doors in zip(cells, boundaries, door_cords):
+        _, _, _, walls, sources, room_corners, room_corner_sources = boundary
+        keep = ~np.isin(walls, doors)
+        wall_cells.append(room_cells[walls[keep]])
+        wall_sources.append(room_cells[sources[keep]])
+        keep = ~np.isin(room_corners, doors)
+        corners.append(room_cells[room_corners[keep]])
+        corner_sources.append(room_cells[room_corner_sources[keep]])
+    interior_counts = np.array([len(boundary[1]) for boundary in boundaries])
+
+    return {
+        "shape": np.array([height, width]),
+        "room_index": room_index,
+        "kinds": kinds,
+        "categories": categories,
+        "links_x": links_x,
+        "links_y": links_y,
+        "wall_cells": np.concatenate(wall_cells),
+        "wall_sources": np.concatenate(wall_sources),
+        "corners": np.concatenate(corners),
+        "corner_sources": np.concatenate(corner_sources),
+        "window_cells": window_cells,
+        "interior_cells": np.concatenate([room_cells[boundary[1]] for room_cells, boundary in zip(cells, boundaries)]),
+        "interior_counts": interior_counts,
+        "interior_starts": np.concatenate([[0], np.cumsum(interior_counts)[:-1]]),
+    }
+
+class Layout:
+    compiled = {}
+
+    def __init__(self, description, arrays):
+        self.description = description
+        self.names = [room["name"] for room in description["rooms"]]
+        for name, value in arrays.items():
+            value.flags.writeable = False
+            setattr(self, name, value)
+        self.height, self.width = (int(size) for size in self.shape)
+
+    @staticmethod
+    def key(description):
+        content = {"version": LAYOUT_VERSION, "layout": description}
+        return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+    @classmethod
+    def load(cls, description, cache_dir=LAYOUT_CACHE):
+        key = cls.key(description)
+        if key not in cls.compiled:
+            path = None if cache_dir is None else os.path.join(cache_dir, key + ".npz")
+            if path is not None and os.path.exists(path):
+                with np.load(path) as data:
+                    arrays = {name: data[name] for name in data.files}
+            else:
+                arrays = compile_layout(description)
+                if path is not None:
+                    os.makedirs(cache_dir, exist_ok=True)
+                    temporary = path + ".tmp.npz"
+                    np.savez_compressed(temporary, **arrays)
+                    os.replace(temporary, path)
+            cls.compiled[key] = cls(description, arrays)
+        return cls.compiled[key]
+
+    @classmethod
+    def from_file(cls, heaters_mode, file_path="layouts.json", cache_dir=LAYOUT_CACHE, hx=0.5):
+        return cls.load(rasterize_plan(load_layouts(file_path), heaters_mode, hx), cache_dir)
+
+class HousePlots:
+    # shared by House and by runs read back from disk; both provide layout, dt, times, outside,
+    # energy_used, average_temperatures, history and merge_rooms
+    def draw_house(self, name):
+        import visualization
+        visualization.draw_house(self, name)
+
+    def show_house_at_time(self, time, name):
+        import visualization
+        visualization.show_house_at_time(self, time, name)
+
+    def plot_all_day(self, name):
+        import visualization
+        visualization.plot_all_day(self, name)
+
+    def plot_results(self, name):
+        import visualization
+        visualization.plot_results(self, name)
+
+    def draw_to_gif(self, name):
+        import visualization
+        visualization.draw_to_gif(self, name)
+
+    def animate_house(self, stride=None, frames=None):
+        import visualization
+        return visualization.animate_house(self, stride, frames)
+
+    def export_animation(self, path, stride=None, frames=None, fps=10, processes=1):
+        import visualization
+        return visualization.export_animation(self, path, stride, frames, fps, processes)
+
+class House(HousePlots):
+    def __init__(self, initial_temperature, outside_temperatures, heaters_mode, heaters_during_work = 3, initial_mode = 3,
+                 snapshot_every = SNAPSHOT_EVERY, snapshot_times = None, record_all = False, integrator = "explicit", dt = None,
+                 layout = None, config = None, duration = 86400, profiler = None, dtype = "float64", backend = "numpy",
+                 outside_interval = 3600, interpolate = False):
+        self.arguments = {"initial_temperature": initial_temperature, "outside_temperatures": outside_temperatures,
+                          "heaters_mode": heaters_mode, "heaters_during_work": heaters_during_work, "initial_mode": initial_mode,
+                          "snapshot_every": snapshot_every, "snapshot_times": snapshot_times, "record_all": record_all,
+                          "integrator": integrator, "dt": dt, "layout": layout, "config": config, "duration": duration,
+                          "profiler": profiler, "dtype": dtype, "backend": backend,
+                          "outside_interval": outside_interval, "interpolate": interpolate}
+        self.config = SimulationConfig.default() if config is None else config
+        self.profiler = NULL_PROFILER if profiler is None else profiler
         self.windows = []
         self.heaters = []
         self.initial_temperature = initial_temperature
-        self.times = np.arange(0, 86400, ht) 
+        self.dt = self.config.ht if dt is None else dt
+        if integrator == "adi" and self.dt > ADI_MAX_STEP:
+            # the implicit field around the heater patch grows too coarse beyond it; at 60 s the far layout drifts
+            warnings.warn(f"krok {self.dt} s przekracza {ADI_MAX_STEP} s, do których schemat ADI porównano ze schematem "
+                          "jawnym; zużycie energii może od niego odbiegać", RuntimeWarning)
+        self.method = integrator
+        self.dtype = np.dtype(dtype)
+        self.kernel = fused_kernel(backend, integrator)
+        self.t = 0
+        self.times = np.arange(0, duration, self.dt) 
+        self.leave_step = int(round(25200 / self.dt))
+        self.return_step = int(round(61200 / self.dt))
+        self.recovery_time = None
         self.ind = 0
         self.temperatures = outside_temperatures
+        self.outside = np.asarray(outside_temperatures, dtype=float)
+        self.batch = np.broadcast_shapes(self.outside.shape[:-1], np.shape(heaters_during_work), np.shape(initial_mode))
         self.heaters_during_work_mode = heaters_during_work
         self.outside_temp_num = 0
+        self.outside_interval = outside_interval
+        self.interpolate = interpolate
         self.energy_used = []
         self.average_temperatures = []
         self.default_heater_mode = initial_mode
+        self.heat_generated = 0
+        self.checking_temp = np.ones(self.batch, dtype=bool)
+        self.recovery_times = np.full(self.batch, np.nan)
 
-        room_1 = Room(25, 20, self.times, self.initial_temperature)
-        room_2 = Room(15, 20, self.times, self.initial_temperature)
-        room_3 = Room(40, 10, self.times, self.initial_temperature)
-        self.rooms = [room_1, room_2, room_3]
-
-        window_1_1 = Window(room_1, [300, 325, 350, 375])
-        window_1_2 = Window(room_1, [484, 485, 486])
-        window_1_3 = Window(room_1, [490, 491, 492, 493])
-        window_2_1 = Window(room_2, [289, 290, 291, 292])
-        window_2_2 = Window(room_2, [239, 254])
-        window_2_3 = Window(room_2, [74, 89, 104, 119, 134])
-        window_3_1 = Window(room_3, [22, 23])
-        self.windows = [window_1_1, window_1_2, window_1_3, window_2_1, window_2_2, window_2_3, window_3_1]
-
-        if heaters_mode == 'close':
-            heater_1_1 = Heater(room_1, [301, 326, 351], self.default_heater_mode)
-            heater_1_2 = Heater(room_1, [459, 460, 461], self.default_heater_mode)
-            heater_1_3 = Heater(room_1, [468, 469], self.default_heater_mode)
-            heater_2_1 = Heater(room_2, [275, 276], self.default_heater_mode)
-            heater_2_2 = Heater(room_2, [88, 103, 118, 133], self.default_heater_mode)
-            heater_2_3 = Heater(room_2, [238, 253, 268], self.default_heater_mode)
-            heater_3_1 = Heater(room_3, [61, 62, 63, 64, 65], self.default_heater_mode)
-            self.heaters = [heater_1_1, heater_1_2, heater_1_3, heater_2_1, heater_2_2, heater_2_3, heater_3_1]
-
-        elif heaters_mode == 'far':
-            heater_1_1 = Heater(room_1, [323, 348], self.default_heater_mode)
-            heater_1_2 = Heater(room_1, [48, 73, 98], self.default_heater_mode)
-            heater_1_3 = Heater(room_1, [32, 33, 34, 35, 36], self.default_heater_mode)
-            heater_2_1 = Heater(room_2, [76, 91], self.default_heater_mode)
-            heater_2_2 = Heater(room_2, [27, 28, 29], self.default_heater_mode)
-            heater_2_2 = Heater(room_2, [136, 151, 166, 181], self.default_heater_mode)
-            heater_2_3 = Heater(room_2, [24, 25, 26], self.default_heater_mode)
-            heater_3_1 = Heater(room_3, [41, 42, 43, 44, 45], self.default_heater_mode)
-            self.heaters = [heater_1_1, heater_1_2, heater_1_3, heater_2_1, heater_2_2, heater_2_3, heater_3_1]
-
-        elif heaters_mode == 'work':
-            heater_1_1 = Heater(room_1, [298, 323, 348], self.default_heater_mode)
-            heater_1_2 = Heater(room_1, [459, 460, 461], self.default_heater_mode)
-            heater_1_3 = Heater(room_1, [101, 126, 151], self.default_heater_mode)
-            heater_2_1 = Heater(room_2, [106, 121], self.default_heater_mode)
-            heater_2_3 = Heater(room_2, [277, 278, 279], self.default_heater_mode)
-            heater_2_4 = Heater(room_2, [163], self.default_heater_mode)
-            heater_3_1 = Heater(room_3, [55, 56, 57, 58, 59], self.default_heater_mode)
-            self.heaters = [heater_1_1, heater_1_2, heater_1_3, heater_2_1, heater_2_3, heater_2_4, heater_3_1]
-
-        door_1 = Door(room_1, room_2, [399, 424], [240, 225]) 
-        door_2 = Door(room_1, room_3, [3, 4], [363, 364])
-        door_3 = Door(room_2, room_3, [6, 7], [391, 392])
-
-        self.doors = [door_1, door_2, door_3]
-
-
-    def main(self):
-        checking_temp = True
-        heat_generated = 0
-        for t in range(1, len(self.times)):   
-            for room in self.rooms:
-                room.step()
-    
-            for window in self.windows:
-                window.room.u[t, window.cords] = self.temperatures[self.outside_temp_num]
+        if record_all:
+            record_every, record_steps = 1, None
+        else:
+            record_every = None if snapshot_every is None else max(1, int(round(snapshot_every / self.dt)))
+            record_steps = None if snapshot_times is None else [int(round(time / self.dt)) for time in snapshot_times]
+            if record_every is None and record_steps is None:
+                record_steps = []
 
-            if t % 7200 == 0:
-                    self.outside_temp_num += 1
+        self.layout = Layout.from_file(heaters_mode, hx=self.config.hx) if layout is None else layout
+        self.height = self.layout.height
+        self.width = self.layout.width
+        self.state = np.zeros((2,) + self.batch + (self.height * self.width,), dtype=self.dtype)
+        self.room_index = self.layout.room_index
+        self.rooms = []
+        for description in self.layout.description["rooms"]:
+            N, M, row, column = description["N"], description["M"], description["row"], description["column"]
+            room = Room(N, M, self.times, self.initial_temperature, record_steps=[], integrator=integrator, config=self.config)
+            local = np.arange(N * M)
+            room.origin = (row, column)
+            room.cells = (row + local // N) * self.width + column + local % N
+            # a weak reference, so a house is freed as soon as it is dropped and not at the next garbage collection
+            room.house = weakref.proxy(self)
+            self.rooms.append(room)
+        self.covered = self.room_index >= 0
+        self.cell_count = np.count_nonzero(self.covered)
+        self.state[0, ..., self.covered] = self.initial_temperature
+        self.history = History(len(self.times), self.batch + (self.height * self.width,), record_every, record_steps,
+                               self.dtype)
+        self.history.record(0, self.state[0])
 
-            for heater in self.heaters:
-                if t == 50400:
-                    heater.set_mode(self.heaters_during_work_mode)
-                elif t == 122400:
-                    heater.set_mode(self.default_heater_mode)
-                for heater in self.heaters:
-                    if heater.get_neighboring_temperature(t) >= heater.max_temperature:
-                        heater.on = False
-                        heater.time = 0
-                    elif heater.get_neighboring_temperature(t) <= heater.max_temperature - 1: 
-                        heater.on = True
-                    if heater.on:
-                        heater.room.u[t, heater.cords] += ht * heat
-                        heat_generated += len(heater.cords) * heat
-                                   
-            self.energy_used.append(heat_generated)
+        rooms = dict(zip(self.layout.names, self.rooms))
+        description = self.layout.description
+        self.windows = [Window(rooms[window["room"]], window["cells"]) for window in description["windows"]]
+        self.heaters = [Heater(rooms[heater["room"]], heater["cells"], self.default_heater_mode, heater.get("weight", 1.0),
+                               heater.get("sensor")) for heater in description["heaters"]]
+        self.doors = [Door(rooms[door["rooms"][0]], rooms[door["rooms"][1]], *door["cells"]) for door in description["doors"]]
+        self.build_grid()
 
-            for door in self.doors:
-                avg_temp = (np.sum(door.room_1.u[t, door.cords_1]) + np.sum(door.room_2.u[t, door.cords_2])) / 4
-                door.room_1.u[t, door.cords_1] = avg_temp
-                door.room_2.u[t, door.cords_2] = avg_temp
-            sum_of_temp = 0
-            for room in self.rooms:
-                sum_of_temp += np.sum(room.u[t, :])
-            avg = sum_of_temp / 1200
-            if t == 50400:
-                print("temperatura przed wyjściem: " + f"{avg}")
-            if t >= 122400 and checking_temp == True:
-                if t == 122400:
-                    print("temperatura po powrocie: " + f"{avg}")
-                m = [room.average_temperature() for room in self.rooms]
-                if all([m[0] >= 19, m[1] >= 19, m[2] >= 19]) and avg > 18:
-                    print(t - 122400)
-                    checking_temp = False
-            self.average_temperatures.append(avg)
+    def build_grid(self):
+        layout = self.layout
+        self.kinds = layout.kinds
+        self.links_x = layout.links_x
+        self.links_y = layout.links_y
+        self.wall_cells = layout.wall_cells
+        self.wall_sources = layout.wall_sources
+        self.corners = layout.corners
+        self.corner_sources = layout.corner_sources
+        self.integrator = INTEGRATORS[self.method](self.kinds.reshape(self.height, self.width), self.config.rate(self.dt),
+                                                   self.links_x, self.links_y, self.dtype)
 
-    def draw_house(self, name):
-        fig, ax = plt.subplots(figsize=(8, 6))
-        ax.set_xlim(0, 40)
-        ax.set_ylim(0, 30)
-        ax.set_xticks(np.arange(41))
-        ax.set_yticks(np.arange(31))
-        ax.grid(True, which='both', color='gray', linestyle='--', linewidth=0.5)
-        ax.set_aspect('equal')
-        
-        for i, room in enumerate(self.rooms):
-            for wall in room.walls:
-                if room == self.rooms[1]:
-                    x = wall % room.N + 25
-                else:
-                    x = wall % room.N
-                if room == self.rooms[2]:
-                    y = wall // room.N
-                else:
-                    y = wall // room.N + 10 
-                ax.add_patch(patches.Rectangle((x, y), 1, 1, color='black'))
-                
-        for window in self.windows:
-            for cord in window.cords:
-                if window.room == self.rooms[1]:
-                    x = cord % window.room.N + 25
-                else:
-                    x = cord % window.room.N
-                y = cord // window.room.N + 10
-                if window.room == self.rooms[2]:
-                    y = cord // window.room.N
-                else:
-                    y = cord // window.room.N + 10
-                ax.add_patch(patches.Rectangle((x, y), 1, 1, color='blue'))
-                
-        for heater in self.heaters:
-            for cord in heater.cords:
-                if heater.room == self.rooms[1]:
-                    x = cord % heater.room.N + 25
-                else:
-                    x = cord % heater.room.N
-                if heater.room == self.rooms[2]:
-                    y = cord // heater.room.N 
-                else:
-                    y = cord // heater.room.N + 10
-                ax.add_patch(patches.Rectangle((x, y), 1, 1, color='orange'))
-
-        for door in self.doors:
-            for cord in door.cords_1:
-                if door.room_1 == self.rooms[1]:
-                    x = cord % door.room_1.N + 25
-                else:
-                    x = cord % door.room_1.N
-                if door.room_1 == self.rooms[2]:
-                    y = cord // door.room_1.N
-                else:
-                    y = cord // door.room_1.N + 10
-                ax.add_patch(patches.Rectangle((x, y), 1, 1, color='white'))
-
-            for cord in door.cords_2:
-                if door.room_2 == self.rooms[1]:
-                    x = cord % door.room_2.N + 25
-                else:
-                    x = cord % door.room_2.N
-                if door.room_2 == self.rooms[2]:
-                    y = cord // door.room_2.N
-                else:
-                    y = cord // door.room_2.N + 10
-                ax.add_patch(patches.Rectangle((x, y), 1, 1, color='white'))
-            
-                
-        ax.text(12, 20, 'Pokój 1', fontsize=12, fontweight='bold', color='black', ha='center')
-        ax.text(32, 20, 'Pokój 2', fontsize=12, fontweight='bold', color='black', ha='center')
-        ax.text(20, 5, 'Pokój 3', fontsize=12, fontweight='bold', color='black', ha='center')
-        
-        plt.savefig(f"{name}_house.png", bbox_inches='tight')
-        plt.close()
+        self.window_cells = layout.window_cells
+        self.interior_cells = layout.interior_cells
+        self.interior_counts = layout.interior_counts
+        self.interior_starts = layout.interior_starts
 
+        self.heater_bank = HeaterBank(self.heaters, passes=self.layout.description.get("heater_passes", 1), batch=self.batch)
+        self.heater_bank.set_mode(self.default_heater_mode)
+        self.heater_patch = None
+        if self.method == "adi":
+            substeps = max(1, int(np.ceil(self.dt / self.config.ht - 1e-9)))
+            rings = int(np.ceil(PATCH_RINGS * np.sqrt(self.config.rate(self.dt))))
+            self.heater_patch = HeaterPatch(self, self.heater_bank, substeps, rings)
 
-    def show_house_at_time(self, time, name):
-        time_idx = int(time / ht)  
+    def diffuse(self, previous, out):
+        grid = previous.shape[:-1] + (self.height, self.width)
+        self.integrator.step(previous.reshape(grid), out.reshape(grid))
 
-        for room in self.rooms:
-            room.t = time_idx  
+    def copy_walls(self, u):
+        u[..., self.wall_cells] = u[..., self.wall_sources]
+        u[..., self.corners] = u[..., self.corner_sources]
 
-        full_map = self.merge_rooms()  
+    def advance(self, previous, out):
+        self.diffuse(previous, out)
+        self.copy_walls(out)
 
-        plt.figure(figsize=(8, 6))
-        plt.pcolormesh(full_map, shading='auto', cmap='plasma', vmin=min(self.temperatures), vmax=35)
-        plt.colorbar(label="Temperatura [°C]")
-        plt.xlabel("x")
-        plt.ylabel("y")
-        # plt.title(f"Rozkład temperatury w całym mieszkaniu (t = {time / 3600} h)")
-        # plt.show()
-        plt.savefig(f"{name}_{time}.png")
-        plt.close()
+    def run_heaters(self, previous, u, new_mode=None):
+        if self.heater_patch is None:
+            return self.heater_bank.update(u, self.config.heat, self.dt, new_mode)
+        return self.heater_patch.update(previous, u, self.config.heat, new_mode)
 
-    def merge_rooms(self):
-        m0 = self.rooms[0].u  
-        m1 = self.rooms[1].u  
-        m2 = self.rooms[2].u  
+    def outside_at(self, t, steps_per_sample):
+        value = self.outside[..., self.outside_temp_num]
+        if self.interpolate and self.outside_temp_num + 1 < self.outside.shape[-1]:
+            fraction = ((t - 1) % steps_per_sample) / steps_per_sample
+            value = value + fraction * (self.outside[..., self.outside_temp_num + 1] - value)
+        return value
 
-        m0_rows, m0_cols = self.rooms[0].M, self.rooms[0].N
-        m1_rows, m1_cols = self.rooms[1].M, self.rooms[1].N
-        m2_rows, m2_cols = self.rooms[2].M, self.rooms[2].N
+    def fused_step(self, previous, out, outside):
+        cells = self.height * self.width
+        outside = np.broadcast_to(outside, self.batch).reshape(-1)
+        self.kernel(previous.reshape(-1, cells), out.reshape(-1, cells), self.config.rate(self.dt),
+                    self.links_x, self.links_y, self.wall_cells, self.wall_sources, self.corners, self.corner_sources,
+                    self.window_cells, outside.astype(self.dtype))
 
-        result = np.full((m2_rows + m0_rows, m2_cols), np.nan)
+    def room_averages(self, u):
+        return group_mean(u[..., self.interior_cells], self.interior_starts, self.interior_counts)
 
-        result[:m2_rows, :] = m2[self.rooms[2].t].reshape(m2_rows, m2_cols)
+    def describe(self):
+        return self.layout.description
 
-        result[m2_rows:, :m0_cols] = m0[self.rooms[0].t].reshape(m0_rows, m0_cols)
-        result[m2_rows:, m0_cols:] = m1[self.rooms[1].t].reshape(m1_rows, m1_cols)
+    @classmethod
+    def screening(cls, *args, factor=1, config=None, **kwargs):
+        # long ADI steps on the same grid; a coarser grid thickens the walls, which take the rooms' area away
+        config = SimulationConfig.default() if config is None else config
+        kwargs = {"integrator": "adi", "dt": ADI_MAX_STEP, **kwargs}
+        return cls(*args, config=config.replace(hx=config.hx * factor), **kwargs)
 
-        return result
-    
-    def plot_all_day(self, name):
-        fig, axes = plt.subplots(3, 4, figsize=(18, 12))
-        # fig, axes = plt.subplots(4, 6, figsize=(18, 12))  
-        axes = axes.flatten()  
-
-        time_indices = [int(hour * 7200 / ht) for hour in range(12)]  
-
-        for i, time_index in enumerate(time_indices):
-            for room in self.rooms:
-                room.t = time_index  
-            
-            full_map = self.merge_rooms()
-            im = axes[i].pcolormesh(full_map, shading='auto', cmap='plasma', vmin=-5, vmax=35)
-            axes[i].set_title(f"{2 * i}:00 h")
-
-        bar = fig.colorbar(im, ax=axes, orientation='horizontal', fraction=0.03, pad=0.05)
-        bar.set_label('Temperatura (°C)')
-        plt.savefig(f"{name}.png")
-        plt.close()
-        print("Energia: " + f"{self.energy_used[-1]}")
+    @classmethod
+    def ensemble(cls, initial_temperature, heaters_mode, scenarios, **kwargs):
+        outside_temperatures, initial_modes, away_modes = zip(*scenarios)
+        return cls(initial_temperature, np.array(outside_temperatures), heaters_mode, np.array(away_modes), np.array(initial_modes), **kwargs)
 
-    def plot_results(self, name):
-        time_hours = self.times[:len(self.energy_used)] / 3600
+    def results(self):
+        energy_used = np.array(self.energy_used).reshape((-1,) + self.batch)
+        average_temperatures = np.array(self.average_temperatures).reshape((-1,) + self.batch)
+        recovery_time = np.broadcast_to(self.recovery_time, self.batch)
+        return [{"energy_used": energy_used[(slice(None),) + i], "average_temperatures": average_temperatures[(slice(None),) + i],
+                 "recovery_time": None if np.isnan(recovery_time[i]) else float(recovery_time[i])} for i in np.ndindex(self.batch)]
 
-        fig, ax1 = plt.subplots(figsize=(10, 5))
+    def notify(self, observers, kind, t, **data):
+        event = Event(kind, t, t * self.dt, data)
+        stop = False
+        for observer in observers:
+            if kind in observer.kinds:
+                stop = bool(observer.notify(event)) or stop
+        return stop
 
-        ax1.set_xlabel('Czas (h)')
-        ax1.set_ylabel('Ciepło oddane (J)', color='red')
-        ax1.plot(time_hours, self.energy_used, color='red', label="Oddane ciepło")
-        ax1.tick_params(axis='y', labelcolor='red')
+    def main(self, observers=None, sample_every=None, until=None):
+        observers = [ConsoleObserver()] if observers is None else list(observers)
+        listening = set().union(*(observer.kinds for observer in observers))
+        sample_steps = max(1, int(round(sample_every / self.dt))) if sample_every is not None and "sample" in listening else None
+        checking_temp = self.checking_temp
+        recovery_time = self.recovery_times
+        heat_generated = self.heat_generated
+        steps_per_sample = int(round(self.outside_interval / self.dt))
+        profiler = self.profiler
+        end = len(self.times) if until is None else min(until + 1, len(self.times))
+        for t in range(self.t + 1, end):   
+            profiler.step(t)
+            self.t = t
+            u = self.state[t % 2]
+            outside = self.outside_at(t, steps_per_sample)
+            previous = self.state[(t - 1) % 2]
+            if self.heater_patch is not None:
+                previous = self.heater_patch.detach(previous)
+            if self.kernel is None:
+                # the phases are timed here only, so calls to advance() outside a run never show up in the profile
+                self.diffuse(previous, u)
+                profiler.lap("diffusion")
+                self.copy_walls(u)
+                profiler.lap("walls")
+                u[..., self.window_cells] = outside[..., None]
+            else:
+                self.fused_step(previous, u, outside)
+                profiler.lap("diffusion")
 
-        ax2 = ax1.twinx()
-        ax2.set_ylabel('Średnia temperatura (°C)', color='blue')
-        ax2.plot(time_hours, self.average_temperatures, color='blue', label="Średnia temperatura")
-        ax2.tick_params(axis='y', labelcolor='blue')
+            if t % steps_per_sample == 0:
+                    self.outside_temp_num += 1
+            profiler.lap("windows")
 
-        fig.tight_layout()
-        plt.title("Oddane ciepło i średnia temperatura w czasie")
-        plt.grid()
-        plt.savefig(f"{name}.png", bbox_inches='tight')
-        plt.close()
+            new_mode = None
+            if t == self.leave_step:
+                new_mode = self.heaters_during_work_mode
+            elif t == self.return_step:
+                new_mode = self.default_heater_mode
+            stop = False
+            if "thermostat" in listening:
+                previous_on = self.heater_bank.on.copy()
+            heat_generated = heat_generated + self.run_heaters(previous, u, new_mode) * self.dt * self.config.energy_scale
+            if "thermostat" in listening:
+                changed = self.heater_bank.on != previous_on
+                if np.any(changed):
+                    stop = self.notify(observers, "thermostat", t, on=self.heater_bank.on.copy(), changed=changed) or stop
+                                   
+            self.energy_used.append(heat_generated)
+            profiler.lap("heaters")
 
-    def draw_to_gif(self, name):
-        for time in range(13):
-            self.show_house_at_time(3600 * (7 + time / 12), name)
-            self.show_house_at_time(3600 * (17 + time / 12), name)
+            self.history.record(t, u)
+            profiler.lap("history")
+            avg = np.sum(u, axis=-1, dtype=np.float64) / self.cell_count
+            profiler.lap("averages")
+            if t == self.leave_step:
+                stop = self.notify(observers, "phase", t, phase="away", mode=self.heaters_during_work_mode,
+                                   average_temperature=avg) or stop
+            if t >= self.return_step and np.any(checking_temp):
+                if t == self.return_step:
+                    stop = self.notify(observers, "phase", t, phase="home", mode=self.default_heater_mode,
+                                       average_temperature=avg) or stop
+                m = self.room_averages(u)
+                reached = checking_temp & np.all(m >= 19, axis=-1) & (avg > 18)
+                if np.any(reached):
+                    recovery_time[reached] = (t - self.return_step) * self.dt
+                    checking_temp = checking_temp & ~reached
+                    stop = self.notify(observers, "recovery", t, steps=t - self.return_step,
+                                       recovery_time=(t - self.return_step) * self.dt, reached=reached,
+                                       remaining=int(np.count_nonzero(checking_temp))) or stop
+            self.average_temperatures.append(avg)
+            if sample_steps is not None and t % sample_steps == 0:
+                stop = self.notify(observers, "sample", t, average_temperature=avg, energy_used=heat_generated,
+                                   room_averages=self.room_averages(u),
+                                   outside_temperature=self.outside_at(t + 1, steps_per_sample)) or stop
+            profiler.lap("recovery")
+            if stop:
+                break
+        profiler.finish()
+        self.heat_generated = heat_generated
+        self.checking_temp = checking_temp
+        if self.batch:
+            self.recovery_time = recovery_time
+        else:
+            self.recovery_time = None if np.isnan(recovery_time) else float(recovery_time)
 
+    def checkpoint(self):
+        return Checkpoint(self)
 
-    def animate_house(self):
-        fig, ax = plt.subplots()
-        
-        full_map = self.merge_rooms()
-        heatmap = ax.pcolormesh(full_map, shading='auto', cmap='plasma', vmin=min(self.temperatures), vmax=35)
-        plt.colorbar(heatmap, label="Temperatura")
-        ax.set_title("Rozkład temperatury w całym mieszkaniu")
-        
-        def update(frame):
-            for room in self.rooms:
-                room.t = frame  
-            full_map = self.merge_rooms()
-            heatmap.set_array(full_map.ravel())
-            ax.set_title(f"Rozkład temperatury - krok {frame}")
+    def restore(self, checkpoint):
+        if (checkpoint.dt != self.dt or checkpoint.field.shape[-1] != self.state.shape[-1]
+                or (checkpoint.patch_field is None) != (self.heater_patch is None)):
+            raise ValueError("punkt kontrolny pochodzi z innej siatki, innego kroku czasowego lub innego schematu")
+        samples = checkpoint.outside_temp_num + (2 if self.interpolate else 1)
+        if not np.all(self.outside[..., :samples] == checkpoint.outside[..., :samples]):
+            raise ValueError("temperatury zewnętrzne różnią się przed punktem kontrolnym")
+        if checkpoint.t > 0 and not np.all(np.asarray(self.default_heater_mode) == checkpoint.default_heater_mode):
+            raise ValueError("tryb początkowy grzejników różni się przed punktem kontrolnym")
+        if checkpoint.t >= self.leave_step and not np.all(np.asarray(self.heaters_during_work_mode) == checkpoint.heaters_during_work_mode):
+            raise ValueError(f"tryb podczas nieobecności obowiązuje już od kroku {self.leave_step}")
+
+        def batched(value):
+            value = np.broadcast_to(value, self.batch).copy()
+            return value if self.batch else value[()]
+
+        self.t = checkpoint.t
+        self.state[self.t % 2] = checkpoint.field
+        self.heater_bank.modes[...] = checkpoint.modes
+        self.heater_bank.on[...] = checkpoint.on
+        if self.heater_patch is not None:
+            self.heater_patch.field[...] = checkpoint.patch_field
+        self.outside_temp_num = checkpoint.outside_temp_num
+        self.heat_generated = batched(checkpoint.heat_generated)
+        self.energy_used = [batched(value) for value in checkpoint.energy_used]
+        self.average_temperatures = [batched(value) for value in checkpoint.average_temperatures]
+        self.checking_temp = np.broadcast_to(checkpoint.checking_temp, self.batch).copy()
+        self.recovery_times = np.broadcast_to(checkpoint.recovery_times, self.batch).copy()
+        for step, values in zip(checkpoint.history_steps, checkpoint.history_data):
+            if step in self.history:
+                self.history.record(step, values)
+
+    def next_day(self, outside_temperatures):
+        if self.t != len(self.times) - 1:
+            raise ValueError("poprzednia doba nie została jeszcze zakończona")
+        outside = np.asarray(outside_temperatures, dtype=float)
+        if np.broadcast_shapes(outside.shape[:-1], self.batch) != self.batch:
+            raise ValueError("temperatury zewnętrzne nie pasują do liczby scenariuszy")
+        # the last day ends half a step short of midnight; the step up to midnight is taken here with the old
+        # weather and becomes the first state of the new day, its heat counts towards the new day
+        previous, u = self.state[self.t % 2], self.state[(self.t + 1) % 2]
+        if self.heater_patch is not None:
+            previous = self.heater_patch.detach(previous)
+        outside_now = self.outside_at(self.t + 1, int(round(self.outside_interval / self.dt)))
+        if self.kernel is None:
+            self.advance(previous, u)
+            u[..., self.window_cells] = outside_now[..., None]
+        else:
+            self.fused_step(previous, u, outside_now)
+        heat = self.run_heaters(previous, u) * self.dt * self.config.energy_scale
+        field = u.copy()
+        self.arguments["outside_temperatures"] = outside_temperatures
+        self.temperatures = outside_temperatures
+        self.outside = outside
+        self.outside_temp_num = 0
+        self.t = 0
+        self.state[0] = field
+        self.heat_generated = heat
+        self.energy_used = []
+        self.average_temperatures = []
+        self.checking_temp = np.ones(self.batch, dtype=bool)
+        self.recovery_times = np.full(self.batch, np.nan)
+        self.recovery_time = None
+        self.history.data[...] = 0
+        self.history.record(0, field)
+
+    def fork(self, checkpoint=None, **changes):
+        fixed = {"initial_temperature", "heaters_mode", "layout", "config", "integrator", "dt"} & changes.keys()
+        if fixed:
+            raise ValueError(f"nie można zmienić {', '.join(sorted(fixed))} przy rozgałęzieniu symulacji")
+        checkpoint = self.checkpoint() if checkpoint is None else checkpoint
+        house = House(**{**self.arguments, "layout": self.layout, **changes})
+        house.restore(checkpoint)
+        return house
+
+    def project_from(self, other, t=None):
+        canvas = resample(other.merge_rooms(t), other.config.hx, self.config.hx, (self.height, self.width))
+        values = canvas.reshape(canvas.shape[:-2] + (-1,))[..., self.covered]
+        current = self.state[self.t % 2]
+        current[..., self.covered] = np.where(np.isnan(values), current[..., self.covered], values)
+
+    def merge_rooms(self, t=None):
+        values = self.state[self.t % 2] if t is None else self.history[t]
+        return np.where(self.covered, values, np.nan).reshape(self.batch + (self.height, self.width))
+
+
+def overlap_weights(source_count, source_hx, target_count, target_hx):
+    source_edges = np.arange(source_count + 1) * source_hx
+    target_edges = np.arange(target_count + 1) * target_hx
+    lower = np.maximum(target_edges[:-1, None], source_edges[None, :-1])
+    upper = np.minimum(target_edges[1:, None], source_edges[None, 1:])
+    return np.clip(upper - lower, 0, None)
+
+def resample(canvas, source_hx, target_hx, shape=None):
+    # area-weighted remapping between grids; NaN cells (outside the house) carry no weight
+    height, width = canvas.shape[-2:]
+    if shape is None:
+        shape = (to_cells(height * source_hx, target_hx), to_cells(width * source_hx, target_hx))
+    rows = overlap_weights(height, source_hx, shape[0], target_hx)
+    columns = overlap_weights(width, source_hx, shape[1], target_hx)
+    valid = ~np.isnan(canvas)
+    total = rows @ np.where(valid, canvas, 0) @ columns.T
+    weight = rows @ valid @ columns.T
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(weight > 0, total / weight, np.nan)
+
+class Checkpoint:
+    def __init__(self, house):
+        self.t = house.t
+        self.dt = house.dt
+        self.field = house.state[house.t % 2].copy()
+        self.modes = house.heater_bank.modes.copy()
+        self.on = house.heater_bank.on.copy()
+        self.patch_field = None if house.heater_patch is None else house.heater_patch.field.copy()
+        self.outside = house.outside.copy()
+        self.outside_temp_num = house.outside_temp_num
+        self.default_heater_mode = np.copy(house.default_heater_mode)
+        self.heaters_during_work_mode = np.copy(house.heaters_during_work_mode)
+        self.heat_generated = np.copy(house.heat_generated)
+        self.energy_used = list(house.energy_used)
+        self.average_temperatures = list(house.average_temperatures)
+        self.checking_temp = house.checking_temp.copy()
+        self.recovery_times = house.recovery_times.copy()
+        recorded = house.history.steps <= house.t
+        self.history_steps = house.history.steps[recorded]
+        self.history_data = house.history.data[recorded].copy()
+
+
+def run_deviation(reference, house):
+    reference.main()
+    house.main()
 
-        ani = animation.FuncAnimation(fig, update, frames=len(self.times), interval=0.005, repeat=False)
-        plt.show()
+    reference_average = np.interp(house.times[1:], reference.times[1:], reference.average_temperatures)
+    average_error = np.abs(np.array(house.average_temperatures) - reference_average)
+    # fields on different grids are not compared cell by cell
+    field_error = 0 if house.state.shape == reference.state.shape else np.nan
+    for step in house.history.steps if field_error == 0 else ():
+        reference_step = int(round(step * house.dt / reference.dt))
+        if reference_step in reference.history:
+            field_error = max(field_error, np.max(np.abs(house.merge_rooms(step) - reference.merge_rooms(reference_step))))
+    return {
+        "average_temperature_max": average_error.max(),
+        "average_temperature_mean": average_error.mean(),
+        "field_max": field_error,
+        "energy_relative": house.energy_used[-1] / reference.energy_used[-1] - 1,
+        "recovery_time": (house.recovery_time, reference.recovery_time),
+    }
 
+def integrator_deviation(initial_temperature, outside_temperatures, heaters_mode, heaters_during_work = 3, initial_mode = 3,
+                         integrator = "adi", dt = None, reference_dt = None):
+    reference = House(initial_temperature, outside_temperatures, heaters_mode, heaters_during_work, initial_mode,
+                      dt=reference_dt)
+    house = House(initial_temperature, outside_temperatures, heaters_mode, heaters_during_work, initial_mode,
+                  integrator=integrator, dt=dt)
+    return run_deviation(reference, house)
 
+def integrator_convergence(initial_temperature, outside_temperatures, heaters_mode, heaters_during_work = 3, initial_mode = 3,
+                           integrator = "adi", steps = (30, 20, 10, 5), reference_dt = 0.125):
+    # the explicit scheme at a step well below ht stands in for the converged solution
+    reference = House(initial_temperature, outside_temperatures, heaters_mode, heaters_during_work, initial_mode,
+                      dt=reference_dt)
+    return {dt: run_deviation(reference, House(initial_temperature, outside_temperatures, heaters_mode, heaters_during_work,
+                                               initial_mode, integrator=integrator, dt=dt))
+            for dt in steps}
 
+def screening_deviation(initial_temperature, outside_temperatures, heaters_mode, heaters_during_work = 3, initial_mode = 3,
+                        factor = 1):
+    reference = House(initial_temperature, outside_temperatures, heaters_mode, heaters_during_work, initial_mode)
+    house = House.screening(initial_temperature, outside_temperatures, heaters_mode, heaters_during_work, initial_mode,
+                            factor=factor)
+    return run_deviation(reference, house)
 
+def precision_deviation(initial_temperature, outside_temperatures, heaters_mode, heaters_during_work = 3, initial_mode = 3,
+                        integrator = "explicit", dt = None, dtype = "float32", backend = "numpy"):
+    # same scheme and step in float64 as the reference; the on/off thermostat may switch a step earlier or later,
+    # so compare energy and averages rather than single cells
+    reference = House(initial_temperature, outside_temperatures, heaters_mode, heaters_during_work, initial_mode,
+                      integrator=integrator, dt=dt)
+    house = House(initial_temperature, outside_temperatures, heaters_mode, heaters_during_work, initial_mode,
+                  integrator=integrator, dt=dt, dtype=dtype, backend=backend)
+    return run_deviation(reference, house)
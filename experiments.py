@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from Project import LAYOUT_VERSION, House
+
+# part of every cache key; bump it whenever a change to the model or to the stored arrays alters results
+RESULT_VERSION = 6
+
+DEFAULT_SNAPSHOT_TIMES = ([7200 * hour for hour in range(12)]
+                          + [3600 * (7 + time / 12) for time in range(13)]
+                          + [3600 * (17 + time / 12) for time in range(13)])
+
+def scenario_key(house, scenario, snapshot_times):
+    description = {
+        "version": [RESULT_VERSION, LAYOUT_VERSION],
+        "constants": house.config.as_dict(),
+        "layout": house.describe(),
+        "scenario": {name: np.asarray(value).tolist() for name, value in sorted(scenario.items())
+                     if name != "config"},
+        "snapshot_times": [float(time) for time in snapshot_times],
+    }
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+def prefix_key(scenario):
+    # scenarios that differ only in the away mode are identical until the household leaves
+    shared = {name: value.as_dict() if name == "config" else np.asarray(value).tolist()
+              for name, value in scenario.items() if name != "heaters_during_work"}
+    return json.dumps(shared, sort_keys=True)
+
+def collect(house):
+    return {
+        "energy_used": np.array(house.energy_used),
+        "average_temperatures": np.array(house.average_temperatures),
+        "recovery_time": np.nan if house.recovery_time is None else house.recovery_time,
+        "snapshot_steps": house.history.steps,
+        "snapshots": house.history.data,
+        "final_state": house.state[house.t % 2],
+        "heater_modes": house.heater_bank.modes,
+        "heater_on": house.heater_bank.on,
+        "patch_field": np.zeros(0) if house.heater_patch is None else house.heater_patch.field,
+        "outside_temp_num": house.outside_temp_num,
+        "checking_temp": house.checking_temp,
+    }
+
+def simulate(scenarios, snapshot_times):
+    base = House(**scenarios[0], snapshot_every=None, snapshot_times=snapshot_times)
+    if len(scenarios) == 1:
+        base.main()
+        return [collect(base)]
+    base.main(until=base.leave_step - 1)
+    checkpoint = base.checkpoint()
+    results = []
+    for scenario in scenarios:
+        house = base.fork(checkpoint, heaters_during_work=scenario.get("heaters_during_work", 3))
+        house.main()
+        results.append(collect(house))
+    return results
+
+def restore(house, result):
+    if not np.array_equal(house.history.steps, result["snapshot_steps"]):
+        raise ValueError("zapisane kroki nie pasują do scenariusza")
+    house.energy_used = list(result["energy_used"])
+    house.average_temperatures = list(result["average_temperatures"])
+    house.recovery_time = None if np.isnan(result["recovery_time"]) else float(result["recovery_time"])
+    house.history.data[...] = result["snapshots"]
+    house.t = len(house.times) - 1
+    house.state[house.t % 2] = result["final_state"]
+    house.heater_bank.modes[...] = result["heater_modes"]
+    house.heater_bank.on[...] = result["heater_on"]
+    if house.heater_patch is not None:
+        house.heater_patch.field[...] = result["patch_field"]
+    house.outside_temp_num = int(result["outside_temp_num"])
+    house.heat_generated = house.energy_used[-1]
+    house.checking_temp = result["checking_temp"].copy()
+    house.recovery_times[...] = result["recovery_time"]
+    return house
+
+def load_cached(path):
+    try:
+        with np.load(path) as data:
+            result = {name: data[name] for name in data.files}
+    except (OSError, ValueError):
+        return None
+    os.utime(path)
+    return result
+
+def store(path, result):
+    temporary = path + ".tmp.npz"
+    np.savez_compressed(temporary, **result)
+    os.replace(temporary, path)
+
+def evict(cache_dir, max_bytes):
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith(".npz") and not name.endswith(".tmp.npz"):
+            stat = os.stat(os.path.join(cache_dir, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        os.remove(os.path.join(cache_dir, name))
+        total -= size
+
+def run_scenarios(scenarios, processes=None, cache_dir=".cache/experiments", max_cache_bytes=2 * 1024**3,
+                  snapshot_times=DEFAULT_SNAPSHOT_TIMES, share_prefix=True):
+    os.makedirs(cache_dir, exist_ok=True)
+    houses = [House(**scenario, snapshot_every=None, snapshot_times=snapshot_times) for scenario in scenarios]
+    paths = [os.path.join(cache_dir, scenario_key(house, scenario, snapshot_times) + ".npz")
+             for house, scenario in zip(houses, scenarios)]
+
+    results = [load_cached(path) if os.path.exists(path) else None for path in paths]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        groups = {}
+        for i in missing:
+            groups.setdefault(prefix_key(scenarios[i]) if share_prefix else i, []).append(i)
+        groups = list(groups.values())
+        tasks = [[scenarios[i] for i in group] for group in groups]
+        processes = processes or os.cpu_count()
+        if processes == 1 or len(tasks) == 1:
+            computed = [simulate(task, snapshot_times) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=min(processes, len(tasks))) as pool:
+                computed = list(pool.map(simulate, tasks, [snapshot_times] * len(tasks)))
+        for group, group_results in zip(groups, computed):
+            for i, result in zip(group, group_results):
+                store(paths[i], result)
+                results[i] = result
+        evict(cache_dir, max_cache_bytes)
+
+    return [restore(house, result) for house, result in zip(houses, results)]
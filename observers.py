@@ -0,0 +1,46 @@
+EVENT_KINDS = frozenset({"phase", "thermostat", "recovery", "sample", "day"})
+
+class Event:
+    def __init__(self, kind, step, time, data):
+        self.kind = kind
+        self.step = step
+        self.time = time
+        self.data = data
+
+    def __repr__(self):
+        return f"Event({self.kind!r}, krok={self.step}, {self.data})"
+
+class Observer:
+    kinds = EVENT_KINDS
+
+    def notify(self, event):
+        return False
+
+class ConsoleObserver(Observer):
+    kinds = frozenset({"phase", "recovery"})
+
+    def notify(self, event):
+        if event.kind == "phase":
+            label = "temperatura przed wyjściem" if event.data["phase"] == "away" else "temperatura po powrocie"
+            print(label + ": " + f"{event.data['average_temperature']}")
+        elif event.kind == "recovery":
+            print(event.data["steps"])
+        return False
+
+class EventLog(Observer):
+    def __init__(self, kinds=EVENT_KINDS):
+        self.kinds = frozenset(kinds)
+        self.events = []
+
+    def notify(self, event):
+        self.events.append(event)
+        return False
+
+    def of_kind(self, kind):
+        return [event for event in self.events if event.kind == kind]
+
+class StopOnRecovery(Observer):
+    kinds = frozenset({"recovery"})
+
+    def notify(self, event):
+        return event.data["remaining"] == 0
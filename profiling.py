@@ -0,0 +1,80 @@
+import json
+from collections import defaultdict
+from time import perf_counter
+
+class NullProfiler:
+    enabled = False
+
+    def step(self, t):
+        pass
+
+    def lap(self, name):
+        pass
+
+    def finish(self):
+        pass
+
+NULL_PROFILER = NullProfiler()
+
+class Profiler:
+    enabled = True
+
+    def __init__(self, trace=False, trace_every=1):
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.step_numbers = []
+        self.step_times = []
+        self.trace = trace
+        self.trace_every = trace_every
+        self.events = []
+        self.origin = perf_counter()
+        self.last = self.origin
+        self.step_start = None
+        self.current_step = None
+
+    def step(self, t):
+        now = perf_counter()
+        if self.step_start is not None:
+            self.step_numbers.append(self.current_step)
+            self.step_times.append(now - self.step_start)
+        self.step_start = now
+        self.current_step = t
+        self.last = now
+
+    def lap(self, name):
+        now = perf_counter()
+        elapsed = now - self.last
+        self.totals[name] += elapsed
+        self.counts[name] += 1
+        if self.trace and self.current_step is not None and self.current_step % self.trace_every == 0:
+            self.events.append((name, self.last - self.origin, elapsed, self.current_step))
+        self.last = now
+
+    def finish(self):
+        self.step(None)
+        self.step_start = None
+
+    def summary(self):
+        total = sum(self.totals.values())
+        return {name: {"seconds": seconds, "calls": self.counts[name], "share": seconds / total if total else 0.0}
+                for name, seconds in sorted(self.totals.items(), key=lambda item: -item[1])}
+
+    def report(self):
+        print(f"{'faza':12s} {'czas [s]':>10s} {'wywołania':>10s} {'udział':>8s}")
+        for name, phase in self.summary().items():
+            print(f"{name:12s} {phase['seconds']:10.3f} {phase['calls']:10d} {100 * phase['share']:7.1f}%")
+        if self.step_times:
+            step_times = sorted(self.step_times)
+            print(f"kroki: {len(step_times)}, mediana {1e6 * step_times[len(step_times) // 2]:.1f} µs, "
+                  f"maks. {1e6 * step_times[-1]:.1f} µs")
+
+    def export_chrome_trace(self, path):
+        events = [{"name": name, "cat": "faza", "ph": "X", "ts": 1e6 * start, "dur": 1e6 * duration,
+                   "pid": 0, "tid": 0, "args": {"krok": step}} for name, start, duration, step in self.events]
+        with open(path, "w") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+
+    def export_folded(self, path, root="House.main"):
+        with open(path, "w") as file:
+            for name, seconds in self.totals.items():
+                file.write(f"{root};{name} {int(round(1e6 * seconds))}\n")
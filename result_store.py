@@ -0,0 +1,176 @@
+import json
+import os
+
+import numpy as np
+
+from Project import HousePlots, Layout, SimulationConfig
+
+SERIES = ("energy_used", "average_temperatures")
+SKIPPED_ARGUMENTS = {"layout", "config", "profiler"}
+
+def write_json(path, value):
+    temporary = path + ".tmp"
+    with open(temporary, "w") as file:
+        json.dump(value, file, indent=1)
+    os.replace(temporary, path)
+
+class ResultWriter:
+    def __init__(self, path, house, chunk_size=32, compress=True):
+        self.path = path
+        self.house = house
+        self.compress = compress
+        self.chunk_size = chunk_size
+        self.written_steps = 0
+        self.written_rows = 0
+        self.chunks = []
+        os.makedirs(os.path.join(path, "snapshots"), exist_ok=True)
+        for name in SERIES + ("snapshot_steps",):
+            open(os.path.join(path, name + ".bin"), "wb").close()
+        self.meta = {
+            "constants": house.config.as_dict(),
+            "layout": house.describe(),
+            "scenario": {name: np.asarray(value).tolist() for name, value in sorted(house.arguments.items())
+                         if name not in SKIPPED_ARGUMENTS},
+            "dt": house.dt,
+            "duration": float(house.times[-1] + house.dt),
+            "batch": list(house.batch),
+            "dtype": house.dtype.name,
+            "outside": house.outside.tolist(),
+            "chunks": self.chunks,
+            "t": 0,
+            "complete": False,
+            "recovery_time": None,
+        }
+
+    def append(self, name, values, dtype):
+        with open(os.path.join(self.path, name + ".bin"), "ab") as file:
+            file.write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+
+    def flush(self):
+        house = self.house
+        rows = len(house.energy_used)
+        if rows > self.written_rows:
+            shape = (-1,) + house.batch
+            self.append("energy_used", np.reshape(house.energy_used[self.written_rows:], shape), np.float64)
+            self.append("average_temperatures", np.reshape(house.average_temperatures[self.written_rows:], shape), np.float64)
+            self.written_rows = rows
+
+        history = house.history
+        recorded = int(np.searchsorted(history.steps, house.t, side="right"))
+        for start in range(self.written_steps, recorded, self.chunk_size):
+            stop = min(start + self.chunk_size, recorded)
+            name = f"chunk_{len(self.chunks):06d}"
+            if self.compress:
+                name += ".npz"
+                np.savez_compressed(os.path.join(self.path, "snapshots", name), data=history.data[start:stop])
+            else:
+                name += ".npy"
+                np.save(os.path.join(self.path, "snapshots", name), history.data[start:stop])
+            self.append("snapshot_steps", history.steps[start:stop], np.int64)
+            self.chunks.append({"file": name, "first": start, "count": stop - start})
+        self.written_steps = recorded
+
+        # the metadata is replaced last, so a reader never sees rows it has no description for
+        self.meta["t"] = house.t
+        self.meta["complete"] = house.t == len(house.times) - 1
+        recovery_time = np.asarray(house.recovery_times if house.batch else np.nan if house.recovery_time is None
+                                   else house.recovery_time)
+        self.meta["recovery_time"] = np.where(np.isnan(recovery_time), None, recovery_time).tolist()
+        write_json(os.path.join(self.path, "meta.json"), self.meta)
+
+def store_run(house, path, observers=None, chunk_size=32, compress=True):
+    # main() is resumed chunk by chunk, which gives the same result as one uninterrupted call
+    writer = ResultWriter(path, house, chunk_size, compress)
+    steps = house.history.steps
+    targets = list(steps[chunk_size - 1::chunk_size]) + [len(house.times) - 1]
+    for target in targets:
+        if target <= house.t:
+            continue
+        house.main(observers, until=target)
+        writer.flush()
+        if house.t < target:
+            break
+    writer.flush()
+    return StoredRun(path)
+
+class StoredSnapshots:
+    def __init__(self, path, chunks):
+        self.path = path
+        self.chunks = chunks
+        self.steps = read_series(os.path.join(path, "snapshot_steps.bin"), np.int64, ())
+        self.starts = np.array([chunk["first"] for chunk in chunks], dtype=int)
+        self.loaded = (None, None)
+
+    def __len__(self):
+        return len(self.steps)
+
+    def __contains__(self, t):
+        i = np.searchsorted(self.steps, t)
+        return i < len(self.steps) and self.steps[i] == t
+
+    def chunk(self, number):
+        if self.loaded[0] != number:
+            path = os.path.join(self.path, "snapshots", self.chunks[number]["file"])
+            if path.endswith(".npz"):
+                with np.load(path) as archive:
+                    data = archive["data"]
+            else:
+                data = np.load(path, mmap_mode="r")
+            self.loaded = (number, data)
+        return self.loaded[1]
+
+    def __getitem__(self, t):
+        i = np.searchsorted(self.steps, t)
+        if i == len(self.steps) or self.steps[i] != t:
+            raise IndexError(f"krok {t} nie został zapisany")
+        number = np.searchsorted(self.starts, i, side="right") - 1
+        return self.chunk(number)[i - self.starts[number]]
+
+def read_series(path, dtype, shape):
+    rows = os.path.getsize(path) // (np.dtype(dtype).itemsize * int(np.prod(shape, dtype=int)))
+    if rows == 0:
+        return np.zeros((0,) + shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(rows,) + shape)
+
+class StoredRun(HousePlots):
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r") as file:
+            self.meta = json.load(file)
+        self.config = SimulationConfig(**self.meta["constants"])
+        self.scenario = self.meta["scenario"]
+        self.layout = Layout.load(self.meta["layout"])
+        self.height = self.layout.height
+        self.width = self.layout.width
+        self.covered = self.layout.room_index >= 0
+        self.dt = self.meta["dt"]
+        self.times = np.arange(0, self.meta["duration"], self.dt)
+        self.t = self.meta["t"]
+        self.complete = self.meta["complete"]
+        self.batch = tuple(self.meta["batch"])
+        self.outside = np.array(self.meta["outside"])
+        recovery_time = self.meta["recovery_time"]
+        self.recovery_time = np.array(recovery_time, dtype=float) if self.batch else recovery_time
+        # a run still being written may have more rows on disk than its metadata describes
+        rows = self.t
+        self.energy_used = read_series(os.path.join(path, "energy_used.bin"), np.float64, self.batch)[:rows]
+        self.average_temperatures = read_series(os.path.join(path, "average_temperatures.bin"), np.float64, self.batch)[:rows]
+        chunks = self.meta["chunks"]
+        snapshots = sum(chunk["count"] for chunk in chunks)
+        self.history = StoredSnapshots(path, chunks)
+        self.history.steps = self.history.steps[:snapshots]
+
+    def describe(self):
+        return self.layout.description
+
+    def merge_rooms(self, t=None):
+        values = self.history[self.history.steps[-1] if t is None else t]
+        return np.where(self.covered, values, np.nan).reshape(self.batch + (self.height, self.width))
+
+    def time_slice(self, start, stop):
+        steps = self.history.steps
+        selected = steps[(steps * self.dt >= start) & (steps * self.dt <= stop)]
+        maps = np.empty((len(selected),) + self.batch + (self.height, self.width))
+        for i, step in enumerate(selected):
+            maps[i] = self.merge_rooms(step)
+        return selected, maps
@@ -23,3 +23,6 @@ house.draw_house("work_anim")
 house.main()
 house.animate_house()
 
+
+# Zapis animacji do pliku (wybrane klatki, renderowanie w kilku procesach):
+# house.export_animation("work_anim.gif", frames=200, processes=4)
@@ -0,0 +1,271 @@
+import argparse
+import contextlib
+import csv
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from Project import ADI_MAX_STEP, House, Layout, Room, SimulationConfig, compile_layout, diff_matrix
+
+BASELINE_FILE = "benchmarks/baseline.json"
+REFERENCE_FILE = "benchmarks/reference.npz"
+
+def outside_temperatures(column="warm"):
+    with open("data.csv", "r") as file:
+        return [int(row[column]) for row in csv.DictReader(file)]
+
+def quietly(function):
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            function()
+    return run
+
+def room_case(n, steps=2000):
+    config = SimulationConfig.default()
+    room = Room(n, n, np.arange(steps + 1) * config.ht, 19, record_steps=[], config=config)
+    room.current[room.interior[::7]] = 40
+
+    def work():
+        for _ in range(steps):
+            room.step(record=False)
+    return work, steps
+
+def diff_matrix_case(n, steps=2000):
+    config = SimulationConfig.default()
+    A = diff_matrix(n, n)
+    rate = config.rate(config.ht)
+    u = np.full(n * n, 19.0)
+    u[::7] = 40
+
+    def work():
+        v = u
+        for _ in range(steps):
+            v = v + rate * (A @ v)
+    return work, steps
+
+def house_case(heaters_mode="far", duration=86400, **kwargs):
+    house = House(19, outside_temperatures(), heaters_mode, 1, duration=duration, **kwargs)
+    return quietly(house.main), len(house.times) - 1
+
+def layout_case(repeats=200):
+    description = Layout.from_file("far").description
+
+    def work():
+        for _ in range(repeats):
+            compile_layout(description)
+    return work, repeats
+
+def construction_case(repeats=200):
+    temperatures = outside_temperatures()
+
+    def work():
+        for _ in range(repeats):
+            House(19, temperatures, "far", 1)
+    return work, repeats
+
+def plotting_case():
+    import matplotlib
+    matplotlib.use("Agg")
+    house = House(19, outside_temperatures(), "work", 0)
+    quietly(house.main)()
+    directory = tempfile.mkdtemp()
+
+    def work():
+        name = os.path.join(directory, "benchmark")
+        house.draw_house(name)
+        house.show_house_at_time(3600 * 7, name)
+        quietly(lambda: house.plot_all_day(name))()
+        house.plot_results(name)
+    return work, 4
+
+CASES = {
+    "room_step_25": lambda: room_case(25),
+    "room_step_50": lambda: room_case(50),
+    "room_step_100": lambda: room_case(100),
+    "room_step_200": lambda: room_case(200, steps=500),
+    "diff_matrix_25": lambda: diff_matrix_case(25),
+    "house_short": lambda: house_case(duration=3600),
+    "house_day": lambda: house_case(),
+    "house_short_adi": lambda: house_case(duration=3600, integrator="adi", dt=ADI_MAX_STEP),
+    "house_day_adi": lambda: house_case(integrator="adi", dt=ADI_MAX_STEP),
+    "house_day_adi_float32": lambda: house_case(integrator="adi", dt=ADI_MAX_STEP, dtype="float32"),
+    "house_short_numba": lambda: house_case(duration=3600, backend="numba"),
+    "layout_compile": lambda: layout_case(),
+    "house_construct": lambda: construction_case(),
+    "plotting": plotting_case,
+}
+NUMBA_CASES = {"house_short_numba"}
+HAS_NUMBA = importlib.util.find_spec("numba") is not None
+SLOW_CASES = {"house_day", "plotting"}
+
+REFERENCE_RUNS = {
+    "far_adi_short": {"heaters_mode": "far", "heaters_during_work": 1, "integrator": "adi", "dt": ADI_MAX_STEP,
+                      "duration": 3600},
+    "close_adi": {"heaters_mode": "close", "heaters_during_work": 0, "integrator": "adi", "dt": ADI_MAX_STEP},
+    "work_adi": {"heaters_mode": "work", "heaters_during_work": 2, "integrator": "adi", "dt": ADI_MAX_STEP},
+    "far_explicit_short": {"heaters_mode": "far", "heaters_during_work": 1, "duration": 3600},
+    "work_explicit_day": {"heaters_mode": "work", "heaters_during_work": 2, "stride": 60},
+}
+SLOW_REFERENCE_RUNS = {"work_explicit_day"}
+
+# single precision is checked against the float64 reference on the totals of a run only: the on/off thermostat
+# turns rounding differences into heaters switching a step earlier or later, which moves single samples
+PRECISION_RUNS = {"far_adi_short", "far_explicit_short", "close_adi", "work_explicit_day"}
+PRECISION_TOLERANCE = {"rtol": 1e-2, "atol": 0.1}
+
+# the fused kernel must reproduce the NumPy step; it is run uncompiled always and compiled when numba is installed
+KERNEL_RUN = {"heaters_mode": "far", "heaters_during_work": 1, "duration": 600}
+KERNEL_TOLERANCE = 1e-9
+
+def measure(name):
+    work, units = CASES[name]()
+    start = time.perf_counter()
+    work()
+    seconds = time.perf_counter() - start
+
+    work, units = CASES[name]()
+    tracemalloc.start()
+    work()
+    _, allocated = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "seconds": seconds,
+        "steps_per_second": units / seconds,
+        "allocated_mb": allocated / 2**20,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+def measure_isolated(name):
+    # a fresh interpreter per case keeps the peak RSS of one case out of the next
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(measure, (name,))
+
+def reference_run(name, **changes):
+    scenario = dict(REFERENCE_RUNS[name], **changes)
+    stride = scenario.pop("stride", 1)
+    house = House(19, outside_temperatures(), **scenario)
+    quietly(house.main)()
+    return {"average_temperatures": np.array(house.average_temperatures)[::stride],
+            "energy_used": np.array(house.energy_used)[::stride]}
+
+def freeze_reference(names):
+    arrays = {}
+    for name in names:
+        for key, values in reference_run(name).items():
+            arrays[f"{name}/{key}"] = values
+    np.savez_compressed(REFERENCE_FILE, **arrays)
+
+def totals(key, values):
+    return values[-1:] if key == "energy_used" else values.mean(axis=0, keepdims=True)
+
+def check_reference(names, rtol=1e-7, atol=1e-7, label="", summary=False, **changes):
+    failures = []
+    with np.load(REFERENCE_FILE) as reference:
+        for name in names:
+            for key, values in reference_run(name, **changes).items():
+                expected = reference[f"{name}/{key}"]
+                if summary:
+                    values, expected = totals(key, values), totals(key, expected)
+                if values.shape != expected.shape:
+                    failures.append(f"{name}/{key}: kształt {values.shape} zamiast {expected.shape}")
+                    continue
+                deviation = np.max(np.abs(values - expected))
+                agrees = np.allclose(values, expected, rtol=rtol, atol=atol)
+                print(f"{name + label:20s} {key:22s} maks. odchylenie {deviation:.3e} {'OK' if agrees else 'BŁĄD'}")
+                if not agrees:
+                    failures.append(f"{name}{label}/{key}")
+    return failures
+
+def kernel_run(backend):
+    house = House(19, outside_temperatures(), **KERNEL_RUN, backend=backend)
+    quietly(house.main)()
+    return {"field": house.state[house.t % 2], "average_temperatures": np.array(house.average_temperatures),
+            "energy_used": np.array(house.energy_used)}
+
+def check_kernels(backends):
+    failures = []
+    expected = kernel_run("numpy")
+    for backend in backends:
+        for key, values in kernel_run(backend).items():
+            deviation = np.max(np.abs(values - expected[key]))
+            agrees = deviation <= KERNEL_TOLERANCE
+            print(f"{'kernel ' + backend:20s} {key:22s} maks. odchylenie {deviation:.3e} {'OK' if agrees else 'BŁĄD'}")
+            if not agrees:
+                failures.append(f"kernel {backend}/{key}")
+    return failures
+
+def load_baseline():
+    if not os.path.exists(BASELINE_FILE):
+        return {}
+    with open(BASELINE_FILE, "r") as file:
+        return json.load(file)
+
+def report(results, baseline, tolerance):
+    regressions = []
+    print(f"{'przypadek':18s} {'kroki/s':>12s} {'bazowo':>12s} {'stosunek':>9s} {'alok. MB':>9s} {'RSS MB':>8s}")
+    for name, result in results.items():
+        base = baseline.get(name, {}).get("steps_per_second")
+        ratio = result["steps_per_second"] / base if base else float("nan")
+        print(f"{name:18s} {result['steps_per_second']:12.1f} {base or float('nan'):12.1f} {ratio:9.2f} "
+              f"{result['allocated_mb']:9.2f} {result['peak_rss_mb']:8.1f}")
+        if base and ratio < 1 - tolerance:
+            regressions.append(name)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pomiary wydajności i kontrola zgodności numerycznej symulacji")
+    parser.add_argument("cases", nargs="*", help="wybrane przypadki (domyślnie wszystkie)")
+    parser.add_argument("--quick", action="store_true", help="pomija pełną dobę schematem jawnym")
+    parser.add_argument("--save-baseline", action="store_true", help="zapisuje wyniki jako nowy punkt odniesienia")
+    parser.add_argument("--freeze-reference", action="store_true", help="zamraża bieżące wyniki jako wzorzec numeryczny")
+    parser.add_argument("--no-reference", action="store_true", help="pomija kontrolę zgodności numerycznej")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="dopuszczalny względny spadek kroków/s")
+    args = parser.parse_args(argv)
+
+    cases = args.cases or [name for name in CASES if not (args.quick and name in SLOW_CASES)]
+    unknown = [name for name in cases if name not in CASES]
+    if unknown:
+        parser.error(f"nieznane przypadki: {', '.join(unknown)}")
+    if not HAS_NUMBA:
+        # a NumPy fallback measured under a numba case name would be a misleading baseline
+        skipped = [name for name in cases if name in NUMBA_CASES]
+        if skipped:
+            print(f"pakiet numba nie jest zainstalowany, pominięto: {', '.join(skipped)}")
+        cases = [name for name in cases if name not in NUMBA_CASES]
+    references = [name for name in REFERENCE_RUNS if not (args.quick and name in SLOW_REFERENCE_RUNS)]
+
+    if args.freeze_reference:
+        freeze_reference(list(REFERENCE_RUNS))
+
+    results = {name: measure_isolated(name) for name in cases}
+    baseline = load_baseline()
+    regressions = report(results, baseline, args.tolerance)
+    if args.save_baseline:
+        baseline.update(results)
+        with open(BASELINE_FILE, "w") as file:
+            json.dump(baseline, file, indent=4)
+
+    failures = []
+    if not args.no_reference:
+        failures += check_reference(references)
+        failures += check_kernels(["python"] + (["numba"] if HAS_NUMBA else []))
+        failures += check_reference([name for name in references if name in PRECISION_RUNS], label=" f32",
+                                    summary=True, dtype="float32", **PRECISION_TOLERANCE)
+    if regressions:
+        print("spadek wydajności: " + ", ".join(regressions))
+    if failures:
+        print("niezgodność z wzorcem: " + ", ".join(failures))
+    return 1 if regressions or failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
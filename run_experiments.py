@@ -1,5 +1,5 @@
 import csv
-from Project import House
+from experiments import run_scenarios
 
 with open("data.csv", 'r') as file:
     temp_csv_reader = csv.DictReader(file)
@@ -12,13 +12,21 @@ with open("data.csv", 'r') as file:
         colder.append(int(col['colder']))
 
 
+scenarios = []
 for position in ["far", "close", "work"]:
     for temp_list in [warm, cold, colder]:
         for i in range(4):
-            print("Rozważamy temperatury " + f"{temp_list[0]}" + " i tryb " + f"{i} i ustawienie {position}")
-            house = House(19, temp_list, position, i)
-            house.draw_house(f"{position}")
-            house.main()
-            house.draw_to_gif(f"{temp_list[0]}_{i}")
-            house.plot_all_day(f"all_{temp_list[0]}_{i}")
-            house.plot_results(f"plot_{temp_list[0]}_{i}")
+            scenarios.append({"initial_temperature": 19, "outside_temperatures": temp_list,
+                              "heaters_mode": position, "heaters_during_work": i})
+
+houses = run_scenarios(scenarios)
+
+for scenario, house in zip(scenarios, houses):
+    position = scenario["heaters_mode"]
+    temp_list = scenario["outside_temperatures"]
+    i = scenario["heaters_during_work"]
+    print("Rozważamy temperatury " + f"{temp_list[0]}" + " i tryb " + f"{i} i ustawienie {position}")
+    house.draw_house(f"{position}")
+    house.draw_to_gif(f"{temp_list[0]}_{i}")
+    house.plot_all_day(f"all_{temp_list[0]}_{i}")
+    house.plot_results(f"plot_{temp_list[0]}_{i}")
@@ -0,0 +1,89 @@
+import csv
+from itertools import islice
+
+import numpy as np
+
+from Project import House
+
+HOURS_PER_DAY = 24
+COMFORT_TEMPERATURE = 19
+
+class WeatherStream:
+    def __init__(self, path, columns="warm"):
+        self.path = path
+        self.columns = columns
+
+    def __iter__(self):
+        # rows are read one at a time, so a season-long file never sits in memory
+        with open(self.path, "r", newline="") as file:
+            for row in csv.DictReader(file, skipinitialspace=True):
+                if isinstance(self.columns, str):
+                    yield float(row[self.columns])
+                else:
+                    yield [float(row[column]) for column in self.columns]
+
+def day_metrics(house, day):
+    average = np.array(house.average_temperatures)
+    steps = np.arange(1, house.t + 1)
+    home = (steps < house.leave_step) | (steps >= house.return_step)
+    shortfall = np.clip(COMFORT_TEMPERATURE - average[home], 0, None)
+    return {
+        "day": day,
+        "hours": (house.t + 1) * house.dt / 3600,
+        "energy_used": house.heat_generated,
+        "mean_temperature": average.mean(axis=0),
+        "min_temperature": average.min(axis=0),
+        "underheating_degree_hours": shortfall.sum(axis=0) * house.dt / 3600,
+        "recovery_time": house.recovery_time,
+        "mean_outside_temperature": house.outside[..., :HOURS_PER_DAY].mean(axis=-1),
+    }
+
+class Season:
+    def __init__(self, initial_temperature, weather, heaters_mode, heaters_during_work = 3, initial_mode = 3, days = None,
+                 interpolate = True, snapshot_every = None, **kwargs):
+        if "duration" in kwargs:
+            raise ValueError("sezon jest liczony dobami, długość ustala parametr days")
+        self.initial_temperature = initial_temperature
+        self.weather = weather
+        self.heaters_mode = heaters_mode
+        self.heaters_during_work = heaters_during_work
+        self.initial_mode = initial_mode
+        self.days = days
+        self.interpolate = interpolate
+        self.snapshot_every = snapshot_every
+        self.kwargs = kwargs
+        self.house = None
+
+    def __iter__(self):
+        return self.run()
+
+    def run(self, observers=()):
+        # one House is reused day after day, so memory depends on the length of a day, not of the season
+        samples = iter(self.weather)
+        day = list(islice(samples, HOURS_PER_DAY))
+        number = 0
+        while day and (self.days is None or number < self.days):
+            following = next(samples, None)
+            # the first hour of the next day closes the interpolation of the last hour
+            hours = day if following is None else day + [following]
+            temperatures = np.moveaxis(np.array(hours, dtype=float), 0, -1)
+            if self.house is None:
+                self.house = House(self.initial_temperature, temperatures, self.heaters_mode, self.heaters_during_work,
+                                   self.initial_mode, snapshot_every=self.snapshot_every, interpolate=self.interpolate,
+                                   **self.kwargs)
+            else:
+                self.house.next_day(temperatures)
+            # a season that ends part-way through a day simulates only the hours it has weather for
+            end = len(self.house.times) - 1
+            if len(day) < HOURS_PER_DAY:
+                end = int(round(len(day) * self.house.outside_interval / self.house.dt)) - 1
+            self.house.main(observers, until=end)
+            if self.house.t != end:
+                return
+            metrics = day_metrics(self.house, number)
+            stop = self.house.notify(observers, "day", self.house.t, **metrics)
+            yield metrics
+            if stop:
+                return
+            number += 1
+            day = [] if following is None else [following] + list(islice(samples, HOURS_PER_DAY - 1))
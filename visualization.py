@@ -0,0 +1,244 @@
+import shutil
+import subprocess
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import matplotlib.pyplot as plt
+import matplotlib.animation as animation
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.colors import ListedColormap
+from matplotlib.figure import Figure
+
+def show_room(room):
+    plt.figure()
+    plt.pcolormesh(room.x, room.y, room.current.reshape(room.M, room.N), shading='auto')
+    plt.colorbar(label="Temperatura")
+    plt.xlabel("x")
+    plt.ylabel("y")
+    plt.title("Rozkład temperatury w czasie końcowym")
+    plt.show()
+
+CATEGORY_COLORS = ListedColormap(["white", "white", "black", "blue", "orange", "white"])
+
+def show_grid(ax, image, **kwargs):
+    height, width = image.shape[-2:]
+    return ax.imshow(image, origin='lower', extent=(0, width, 0, height), interpolation='nearest', **kwargs)
+
+def grid_ticks(size):
+    return np.arange(0, size + 1, max(1, size // 40))
+
+def draw_house(house, name):
+    layout = house.layout
+    fig, ax = plt.subplots(figsize=(8, 6))
+    show_grid(ax, layout.categories.reshape(layout.height, layout.width), cmap=CATEGORY_COLORS,
+              vmin=-0.5, vmax=CATEGORY_COLORS.N - 0.5)
+    ax.set_xlim(0, layout.width)
+    ax.set_ylim(0, layout.height)
+    ax.set_xticks(grid_ticks(layout.width))
+    ax.set_yticks(grid_ticks(layout.height))
+    ax.grid(True, which='both', color='gray', linestyle='--', linewidth=0.5)
+    ax.set_aspect('equal')
+
+    for i, room in enumerate(layout.description["rooms"]):
+        ax.text(room["column"] + room["N"] / 2, room["row"] + room["M"] / 2, f'Pokój {i + 1}', fontsize=12,
+                fontweight='bold', color='black', ha='center')
+
+    plt.savefig(f"{name}_house.png", bbox_inches='tight')
+    plt.close()
+
+
+def show_house_at_time(house, time, name):
+    time_idx = int(round(time / house.dt))  
+
+    full_map = house.merge_rooms(time_idx)  
+
+    fig, ax = plt.subplots(figsize=(8, 6))
+    image = show_grid(ax, full_map, cmap='plasma', vmin=np.min(house.outside), vmax=35, aspect='auto')
+    plt.colorbar(image, label="Temperatura [°C]")
+    plt.xlabel("x")
+    plt.ylabel("y")
+    # plt.title(f"Rozkład temperatury w całym mieszkaniu (t = {time / 3600} h)")
+    # plt.show()
+    plt.savefig(f"{name}_{time}.png")
+    plt.close()
+
+def plot_all_day(house, name):
+    fig, axes = plt.subplots(3, 4, figsize=(18, 12))
+    # fig, axes = plt.subplots(4, 6, figsize=(18, 12))  
+    axes = axes.flatten()  
+
+    time_indices = [int(hour * 7200 / house.dt) for hour in range(12)]  
+
+    for i, time_index in enumerate(time_indices):
+        full_map = house.merge_rooms(time_index)
+        im = show_grid(axes[i], full_map, cmap='plasma', vmin=-5, vmax=35, aspect='auto')
+        axes[i].set_title(f"{2 * i}:00 h")
+
+    bar = fig.colorbar(im, ax=axes, orientation='horizontal', fraction=0.03, pad=0.05)
+    bar.set_label('Temperatura (°C)')
+    plt.savefig(f"{name}.png")
+    plt.close()
+    print("Energia: " + f"{house.energy_used[-1]}")
+
+def plot_results(house, name):
+    time_hours = house.times[:len(house.energy_used)] / 3600
+
+    fig, ax1 = plt.subplots(figsize=(10, 5))
+
+    ax1.set_xlabel('Czas (h)')
+    ax1.set_ylabel('Ciepło oddane (J)', color='red')
+    ax1.plot(time_hours, house.energy_used, color='red', label="Oddane ciepło")
+    ax1.tick_params(axis='y', labelcolor='red')
+
+    ax2 = ax1.twinx()
+    ax2.set_ylabel('Średnia temperatura (°C)', color='blue')
+    ax2.plot(time_hours, house.average_temperatures, color='blue', label="Średnia temperatura")
+    ax2.tick_params(axis='y', labelcolor='blue')
+
+    fig.tight_layout()
+    plt.title("Oddane ciepło i średnia temperatura w czasie")
+    plt.grid()
+    plt.savefig(f"{name}.png", bbox_inches='tight')
+    plt.close()
+
+class FrameRenderer:
+    def __init__(self, shape, vmin, vmax, figsize=(8, 6), dpi=100):
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.axes = self.figure.add_subplot()
+        self.mesh = show_grid(self.axes, np.zeros(shape), cmap='plasma', vmin=vmin, vmax=vmax, aspect='auto')
+        self.figure.colorbar(self.mesh, label="Temperatura [°C]")
+        self.axes.set_xlabel("x")
+        self.axes.set_ylabel("y")
+
+    def render(self, full_map, title=None):
+        self.mesh.set_data(full_map)
+        if title is not None:
+            self.axes.set_title(title)
+        self.canvas.draw()
+        return np.asarray(self.canvas.buffer_rgba())[..., :3].copy()
+
+class GifEncoder:
+    def __init__(self, path, fps):
+        self.file = open(path, "wb")
+        self.duration = 1000 / fps
+        self.palette = None
+
+    def write(self, frame):
+        from PIL import GifImagePlugin, Image
+        image = Image.fromarray(frame)
+        if self.palette is None:
+            # the colour bar shows the whole colour map, so the first frame's palette fits every later frame
+            self.palette = image.quantize(colors=256)
+            indexed = image.quantize(palette=self.palette, dither=Image.Dither.NONE)
+            header, _ = GifImagePlugin.getheader(indexed, info={"loop": 0})
+            self.file.write(b"".join(header))
+        else:
+            indexed = image.quantize(palette=self.palette, dither=Image.Dither.NONE)
+        self.file.write(b"".join(GifImagePlugin.getdata(indexed, duration=self.duration)))
+
+    def close(self):
+        self.file.write(b";")
+        self.file.close()
+
+class FFmpegEncoder:
+    def __init__(self, path, fps):
+        self.path = path
+        self.fps = fps
+        self.process = None
+
+    def write(self, frame):
+        if self.process is None:
+            height, width = frame.shape[:2]
+            self.process = subprocess.Popen(
+                ["ffmpeg", "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}",
+                 "-r", str(self.fps), "-i", "-", "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-pix_fmt", "yuv420p", self.path],
+                stdin=subprocess.PIPE)
+        self.process.stdin.write(np.ascontiguousarray(frame).tobytes())
+
+    def close(self):
+        if self.process is not None:
+            self.process.stdin.close()
+            if self.process.wait() != 0:
+                raise RuntimeError(f"ffmpeg nie zapisał pliku {self.path}")
+
+def open_encoder(path, fps):
+    if path.endswith(".gif"):
+        return GifEncoder(path, fps)
+    if shutil.which("ffmpeg") is None:
+        raise RuntimeError("zapis wideo wymaga programu ffmpeg; zapisz animację do pliku .gif")
+    return FFmpegEncoder(path, fps)
+
+def select_steps(house, stride=None, frames=None):
+    steps = house.history.steps
+    if frames is not None:
+        return steps[np.unique(np.linspace(0, len(steps) - 1, frames).round().astype(int))]
+    return steps[::stride or 1]
+
+renderers = {}
+
+def render_frames(full_maps, titles, vmin, vmax, dpi):
+    key = (full_maps.shape[1:], vmin, vmax, dpi)
+    if key not in renderers:
+        renderers[key] = FrameRenderer(full_maps.shape[1:], vmin, vmax, dpi=dpi)
+    renderer = renderers[key]
+    return [renderer.render(full_map, title) for full_map, title in zip(full_maps, titles)]
+
+def export_animation(house, path, stride=None, frames=None, fps=10, processes=1, chunk_size=16, index=(), dpi=100):
+    steps = select_steps(house, stride, frames)
+    vmin, vmax = float(np.min(house.outside)), 35.0
+    chunks = [steps[start:start + chunk_size] for start in range(0, len(steps), chunk_size)]
+
+    def task(chunk):
+        full_maps = np.stack([house.merge_rooms(step)[index] for step in chunk])
+        titles = [f"Rozkład temperatury - {step * house.dt / 3600:.2f} h" for step in chunk]
+        return full_maps, titles, vmin, vmax, dpi
+
+    encoder = open_encoder(path, fps)
+    try:
+        if processes == 1:
+            for chunk in chunks:
+                for frame in render_frames(*task(chunk)):
+                    encoder.write(frame)
+        else:
+            # only a few chunks are in flight at once, so memory does not grow with the number of frames
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                pending = deque()
+                for chunk in chunks:
+                    pending.append(pool.submit(render_frames, *task(chunk)))
+                    if len(pending) >= 2 * processes:
+                        for frame in pending.popleft().result():
+                            encoder.write(frame)
+                while pending:
+                    for frame in pending.popleft().result():
+                        encoder.write(frame)
+    finally:
+        encoder.close()
+    return len(steps)
+
+def draw_to_gif(house, name):
+    renderer = FrameRenderer(house.merge_rooms(0).shape, np.min(house.outside), 35)
+    for time in range(13):
+        for hour in (7, 17):
+            moment = 3600 * (hour + time / 12)
+            renderer.render(house.merge_rooms(int(round(moment / house.dt))))
+            renderer.figure.savefig(f"{name}_{moment}.png")
+
+
+def animate_house(house, stride=None, frames=None):
+    fig, ax = plt.subplots()
+
+    full_map = house.merge_rooms()
+    heatmap = show_grid(ax, full_map, cmap='plasma', vmin=np.min(house.outside), vmax=35, aspect='auto')
+    plt.colorbar(heatmap, label="Temperatura")
+    ax.set_title("Rozkład temperatury w całym mieszkaniu")
+
+    def update(frame):
+        full_map = house.merge_rooms(frame)
+        heatmap.set_data(full_map)
+        ax.set_title(f"Rozkład temperatury - krok {frame}")
+
+    ani = animation.FuncAnimation(fig, update, frames=select_steps(house, stride, frames), interval=0.005, repeat=False)
+    plt.show()
+    return ani